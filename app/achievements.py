@@ -6,7 +6,7 @@ from typing import Any, Dict
 import psycopg2
 import psycopg2.extras
 
-from .db import get_db_connection
+from .db import db_connection
 
 ACHIEVEMENTS_SEED: list[dict[str, str]] = [
     # Volume
@@ -36,48 +36,41 @@ ACHIEVEMENTS_SEED: list[dict[str, str]] = [
 
 
 def seed_achievements(conn=None) -> None:
-    close_conn = False
     if conn is None:
-        conn = get_db_connection()
-        close_conn = True
-    try:
-        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
-            cursor.execute("SELECT COUNT(*) AS count FROM achievements")
-            if (cursor.fetchone() or {}).get("count"):
-                return
-            cursor.executemany(
-                """
-                INSERT INTO achievements (code, name, description, category)
-                VALUES (%(code)s, %(name)s, %(description)s, %(category)s)
-                ON CONFLICT (code) DO NOTHING
-                """,
-                ACHIEVEMENTS_SEED,
-            )
-        conn.commit()
-    finally:
-        if close_conn:
-            conn.close()
+        with db_connection() as conn:
+            seed_achievements(conn)
+        return
+    with conn.cursor() as cursor:
+        # EXISTS stops at the first row; COUNT(*) would scan the whole table.
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM achievements)")
+        if cursor.fetchone()[0]:
+            return
+        cursor.executemany(
+            """
+            INSERT INTO achievements (code, name, description, category)
+            VALUES (%(code)s, %(name)s, %(description)s, %(category)s)
+            ON CONFLICT (code) DO NOTHING
+            """,
+            ACHIEVEMENTS_SEED,
+        )
+    conn.commit()
 
 
-def _award(cursor, user_id: int, code: str, achievement_map: Dict[str, int]):
-    achievement_id = achievement_map.get(code)
-    if not achievement_id:
+def _award(cursor, user_id: int, codes: list[str]):
+    # One statement awards every earned code; the code -> id lookup happens
+    # in the same query instead of a separate achievements read.
+    if not codes:
         return
     cursor.execute(
         """
         INSERT INTO user_achievements (user_id, achievement_id)
-        VALUES (%s, %s)
+        SELECT %s, id FROM achievements WHERE code = ANY(%s)
         ON CONFLICT (user_id, achievement_id) DO NOTHING
         """,
-        (user_id, achievement_id),
+        (user_id, codes),
     )
 
 
-def _load_achievement_map(cursor) -> Dict[str, int]:
-    cursor.execute("SELECT id, code FROM achievements")
-    return {row[1]: row[0] for row in cursor.fetchall()}
-
-
 def _total_rounds(cursor, user_id: int) -> int:
     cursor.execute(
         """
@@ -164,27 +157,28 @@ def _streak_length(cursor, user_id: int) -> int:
 
 
 def check_and_award_achievements(conn, user_id: int, game_type: str, score_row: Dict[str, Any]):
+    # Runs inside the caller's score transaction; the caller commits once.
     if conn.closed:
         raise RuntimeError("Connection must remain open for achievement checks")
 
     with conn.cursor() as cursor:
-        achievement_map = _load_achievement_map(cursor)
+        earned: list[str] = []
 
         # Volume achievements
         total_rounds = _total_rounds(cursor, user_id)
         if total_rounds >= 10:
-            _award(cursor, user_id, "PLAY_10_GAMES", achievement_map)
+            earned.append("PLAY_10_GAMES")
         if total_rounds >= 50:
-            _award(cursor, user_id, "PLAY_50_GAMES", achievement_map)
+            earned.append("PLAY_50_GAMES")
         if total_rounds >= 100:
-            _award(cursor, user_id, "PLAY_100_GAMES", achievement_map)
+            earned.append("PLAY_100_GAMES")
 
         # Maths totals
         total_qs = _math_question_total(cursor, user_id)
         if total_qs >= 100:
-            _award(cursor, user_id, "MATH_100_QS", achievement_map)
+            earned.append("MATH_100_QS")
         if total_qs >= 1000:
-            _award(cursor, user_id, "MATH_1000_QS", achievement_map)
+            earned.append("MATH_1000_QS")
 
         # Skill checks
         if game_type == "reaction":
@@ -192,39 +186,39 @@ def check_and_award_achievements(conn, user_id: int, game_type: str, score_row:
             accuracy = score_row.get("accuracy")
             if avg_time is not None:
                 if avg_time < 300:
-                    _award(cursor, user_id, "REACTION_SUB_300_MS", achievement_map)
+                    earned.append("REACTION_SUB_300_MS")
                 if avg_time < 250:
-                    _award(cursor, user_id, "REACTION_SUB_250_MS", achievement_map)
+                    earned.append("REACTION_SUB_250_MS")
             if accuracy is not None and accuracy >= 0.99:
-                _award(cursor, user_id, "REACTION_PERFECT_ROUND", achievement_map)
+                earned.append("REACTION_PERFECT_ROUND")
 
         if game_type == "memory":
             if score_row.get("running_total") and score_row.get("running_total") >= 1000:
-                _award(cursor, user_id, "MEMORY_1K_TOTAL", achievement_map)
+                earned.append("MEMORY_1K_TOTAL")
 
         if game_type in {"math_round1", "math_round2", "math_round3", "math"}:
             avg_time_ms = score_row.get("avg_time_ms")
             wrong_count = score_row.get("wrong_count") or 0
             correct_count = score_row.get("correct_count") or 0
             if wrong_count == 0 and correct_count > 0:
-                _award(cursor, user_id, "MATH_PERFECT_ROUND", achievement_map)
+                earned.append("MATH_PERFECT_ROUND")
             if avg_time_ms and avg_time_ms > 0:
                 qpm = 60000 / avg_time_ms
                 if qpm >= 50:
-                    _award(cursor, user_id, "MATH_50_QPM", achievement_map)
+                    earned.append("MATH_50_QPM")
             if wrong_count >= 5 and (correct_count + wrong_count) > 0:
-                _award(cursor, user_id, "TILT_5_WRONG", achievement_map)
+                earned.append("TILT_5_WRONG")
 
         # Exploration
         if _played_all_games(cursor, user_id):
-            _award(cursor, user_id, "PLAYED_ALL_GAMES", achievement_map)
+            earned.append("PLAYED_ALL_GAMES")
 
         # Streaks
         streak = _streak_length(cursor, user_id)
         if streak >= 3:
-            _award(cursor, user_id, "STREAK_3_DAYS", achievement_map)
+            earned.append("STREAK_3_DAYS")
         if streak >= 7:
-            _award(cursor, user_id, "STREAK_7_DAYS", achievement_map)
+            earned.append("STREAK_7_DAYS")
 
         # Time-of-day easter eggs
         created_at = score_row.get("created_at")
@@ -236,9 +230,9 @@ def check_and_award_achievements(conn, user_id: int, game_type: str, score_row:
         if created_at:
             hour = created_at.hour
             if 1 <= hour < 4:
-                _award(cursor, user_id, "NIGHT_OWL", achievement_map)
+                earned.append("NIGHT_OWL")
             if hour < 6:
-                _award(cursor, user_id, "EARLY_BIRD", achievement_map)
+                earned.append("EARLY_BIRD")
 
         # Comeback check: compare last two math sessions
         if game_type == "math_session":
@@ -253,9 +247,9 @@ def check_and_award_achievements(conn, user_id: int, game_type: str, score_row:
             )
             rows = [r[0] for r in cursor.fetchall()]
             if len(rows) == 2 and rows[0] and rows[1] and rows[0] > rows[1] * 1.2:
-                _award(cursor, user_id, "COMEBACK", achievement_map)
+                earned.append("COMEBACK")
 
-    conn.commit()
+        _award(cursor, user_id, earned)
 
 
 def get_user_achievements(conn, user_id: int):
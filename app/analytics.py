@@ -3,7 +3,7 @@ from typing import Any, Dict
 import psycopg2
 import psycopg2.extras
 
-from .db import get_db_connection
+from .db import db_connection
 
 
 def _fetchone(cursor) -> dict | None:
@@ -65,21 +65,9 @@ def get_memory_metrics(conn, user_id: int) -> dict:
     }
 
 
-def _math_accuracy(cursor, table: str, user_id: int, extra_where: str = "") -> tuple[float | None, int]:
-    cursor.execute(
-        f"""
-        SELECT SUM(correct_count) AS correct, SUM(wrong_count) AS wrong, COUNT(*) AS rows
-        FROM {table}
-        WHERE user_id = %s {extra_where}
-        """,
-        (user_id,),
-    )
-    row = _fetchone(cursor) or {}
-    correct = row.get("correct") or 0
-    wrong = row.get("wrong") or 0
-    total_rows = row.get("rows") or 0
-    total = correct + wrong
-    return ((correct / total) if total else None, total_rows)
+def _math_accuracy(correct: int | None, wrong: int | None) -> float | None:
+    total = (correct or 0) + (wrong or 0)
+    return ((correct or 0) / total) if total else None
 
 
 def _math_qpm(avg_time_ms: float | None) -> float | None:
@@ -91,85 +79,73 @@ def _math_qpm(avg_time_ms: float | None) -> float | None:
 
 
 def get_math_metrics(conn, user_id: int) -> dict:
+    # One round trip for every arithmetic aggregate; round 2 and round 3 are
+    # FILTERs over a single pass of the mixed-round table.
     with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
         cursor.execute(
-            "SELECT MAX(score) AS best FROM math_round1_scores WHERE user_id = %s",
-            (user_id,),
-        )
-        round1_best = (_fetchone(cursor) or {}).get("best")
-
-        round1_accuracy, round1_rows = _math_accuracy(cursor, "math_round1_scores", user_id)
-        cursor.execute(
-            "SELECT AVG(avg_time_ms) AS avg_time_ms FROM math_round1_scores WHERE user_id = %s",
-            (user_id,),
-        )
-        round1_qpm = _math_qpm((_fetchone(cursor) or {}).get("avg_time_ms"))
-
-        cursor.execute(
-            "SELECT MAX(score) AS best FROM math_round_mixed_scores WHERE user_id = %s AND (round_index = 2 OR round_index IS NULL)",
-            (user_id,),
-        )
-        round2_best = (_fetchone(cursor) or {}).get("best")
-        round2_accuracy, round2_rows = _math_accuracy(
-            cursor, "math_round_mixed_scores", user_id, "AND (round_index = 2 OR round_index IS NULL)"
-        )
-        cursor.execute(
-            "SELECT AVG(avg_time_ms) AS avg_time_ms FROM math_round_mixed_scores WHERE user_id = %s AND (round_index = 2 OR round_index IS NULL)",
-            (user_id,),
-        )
-        round2_qpm = _math_qpm((_fetchone(cursor) or {}).get("avg_time_ms"))
-
-        cursor.execute(
-            "SELECT MAX(score) AS best FROM math_round_mixed_scores WHERE user_id = %s AND round_index = 3",
-            (user_id,),
-        )
-        round3_best = (_fetchone(cursor) or {}).get("best")
-        round3_accuracy, round3_rows = _math_accuracy(cursor, "math_round_mixed_scores", user_id, "AND round_index = 3")
-        cursor.execute(
-            "SELECT AVG(avg_time_ms) AS avg_time_ms FROM math_round_mixed_scores WHERE user_id = %s AND round_index = 3",
-            (user_id,),
-        )
-        round3_qpm = _math_qpm((_fetchone(cursor) or {}).get("avg_time_ms"))
-
-        # Aggregate for totals across all arithmetic rounds
-        yetamax_rows = round1_rows
-        _, maveric_rows = _math_accuracy(cursor, "math_round_mixed_scores", user_id)
-
-        cursor.execute(
-            "SELECT COALESCE(SUM(correct_count + wrong_count), 0) AS questions FROM math_round1_scores WHERE user_id = %s",
-            (user_id,),
-        )
-        total_questions = (_fetchone(cursor) or {}).get("questions") or 0
-        cursor.execute(
-            "SELECT COALESCE(SUM(correct_count + wrong_count), 0) AS questions FROM math_round_mixed_scores WHERE user_id = %s",
-            (user_id,),
-        )
-        total_questions += (_fetchone(cursor) or {}).get("questions") or 0
-        cursor.execute(
-            "SELECT COALESCE(SUM(correct_count + wrong_count), 0) AS questions FROM math_scores WHERE user_id = %s",
-            (user_id,),
-        )
-        total_questions += (_fetchone(cursor) or {}).get("questions") or 0
-
-        cursor.execute(
-            "SELECT COUNT(*) AS rows, MAX(combined_score) AS best FROM math_session_scores WHERE user_id = %s",
-            (user_id,),
+            """
+            WITH r1 AS (
+                SELECT
+                    MAX(score) AS best,
+                    SUM(correct_count) AS correct,
+                    SUM(wrong_count) AS wrong,
+                    AVG(avg_time_ms) AS avg_time_ms,
+                    COUNT(*) AS rows
+                FROM math_round1_scores
+                WHERE user_id = %(user_id)s
+            ),
+            mixed AS (
+                SELECT
+                    MAX(score) FILTER (WHERE COALESCE(round_index, 2) = 2) AS r2_best,
+                    SUM(correct_count) FILTER (WHERE COALESCE(round_index, 2) = 2) AS r2_correct,
+                    SUM(wrong_count) FILTER (WHERE COALESCE(round_index, 2) = 2) AS r2_wrong,
+                    AVG(avg_time_ms) FILTER (WHERE COALESCE(round_index, 2) = 2) AS r2_avg_time_ms,
+                    MAX(score) FILTER (WHERE round_index = 3) AS r3_best,
+                    SUM(correct_count) FILTER (WHERE round_index = 3) AS r3_correct,
+                    SUM(wrong_count) FILTER (WHERE round_index = 3) AS r3_wrong,
+                    AVG(avg_time_ms) FILTER (WHERE round_index = 3) AS r3_avg_time_ms,
+                    COALESCE(SUM(correct_count + wrong_count), 0) AS mixed_questions,
+                    COUNT(*) AS mixed_rows
+                FROM math_round_mixed_scores
+                WHERE user_id = %(user_id)s
+            )
+            SELECT
+                r1.best AS r1_best,
+                r1.correct AS r1_correct,
+                r1.wrong AS r1_wrong,
+                r1.avg_time_ms AS r1_avg_time_ms,
+                r1.rows AS r1_rows,
+                mixed.*,
+                COALESCE(r1.correct, 0) + COALESCE(r1.wrong, 0) + mixed.mixed_questions + (
+                    SELECT COALESCE(SUM(correct_count + wrong_count), 0)
+                    FROM math_scores
+                    WHERE user_id = %(user_id)s
+                ) AS total_questions,
+                sessions.rows AS session_rows,
+                sessions.best AS session_best
+            FROM r1, mixed, (
+                SELECT COUNT(*) AS rows, MAX(combined_score) AS best
+                FROM math_session_scores
+                WHERE user_id = %(user_id)s
+            ) AS sessions
+            """,
+            {"user_id": user_id},
         )
-        session_row = _fetchone(cursor) or {"rows": 0, "best": None}
+        row = _fetchone(cursor) or {}
 
     return {
-        "round1_best": round1_best,
-        "round1_accuracy": round1_accuracy,
-        "round1_qpm": round1_qpm,
-        "round2_best": round2_best,
-        "round2_accuracy": round2_accuracy,
-        "round2_qpm": round2_qpm,
-        "round3_best": round3_best,
-        "round3_accuracy": round3_accuracy,
-        "round3_qpm": round3_qpm,
-        "total_questions": total_questions,
-        "total_math_sessions": yetamax_rows + maveric_rows + (session_row.get("rows") or 0),
-        "session_best_combined": session_row.get("best"),
+        "round1_best": row.get("r1_best"),
+        "round1_accuracy": _math_accuracy(row.get("r1_correct"), row.get("r1_wrong")),
+        "round1_qpm": _math_qpm(row.get("r1_avg_time_ms")),
+        "round2_best": row.get("r2_best"),
+        "round2_accuracy": _math_accuracy(row.get("r2_correct"), row.get("r2_wrong")),
+        "round2_qpm": _math_qpm(row.get("r2_avg_time_ms")),
+        "round3_best": row.get("r3_best"),
+        "round3_accuracy": _math_accuracy(row.get("r3_correct"), row.get("r3_wrong")),
+        "round3_qpm": _math_qpm(row.get("r3_avg_time_ms")),
+        "total_questions": row.get("total_questions") or 0,
+        "total_math_sessions": (row.get("r1_rows") or 0) + (row.get("mixed_rows") or 0) + (row.get("session_rows") or 0),
+        "session_best_combined": row.get("session_best"),
     }
 
 
@@ -277,8 +253,5 @@ def get_profile_metrics(conn, user_id: int) -> Dict[str, Any]:
 
 
 def get_profile_metrics_for_user(user_id: int) -> Dict[str, Any]:
-    conn = get_db_connection()
-    try:
+    with db_connection(readonly=True) as conn:
         return get_profile_metrics(conn, user_id)
-    finally:
-        conn.close()
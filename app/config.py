@@ -1,15 +1,49 @@
 import os
 from pathlib import Path
 from dotenv import load_dotenv
+import psycopg2
+from psycopg2.extensions import parse_dsn
 
 load_dotenv()
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 TEMPLATE_DIRS = [BASE_DIR / "templates"]
 STATIC_DIR = BASE_DIR / "static"
+TEMPLATES_AUTO_RELOAD = os.getenv("TEMPLATES_AUTO_RELOAD", "false").lower() == "true"
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "5"))
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+
+
+def _default_prepared_statements(database_url: str | None) -> bool:
+    # Transaction-mode poolers (Supabase's port 6543, PgBouncer) hand each
+    # transaction a different backend, so PREPAREd statements go missing.
+    try:
+        port = parse_dsn(database_url or "").get("port")
+    except psycopg2.ProgrammingError:
+        return True
+    return port != "6543"
+
+
+_prepared_statements_env = os.getenv("DB_PREPARED_STATEMENTS")
+DB_PREPARED_STATEMENTS = (
+    _prepared_statements_env.lower() == "true"
+    if _prepared_statements_env
+    else _default_prepared_statements(DATABASE_URL)
+)
+# Optional per-session Postgres settings; empty means "server default".
+# e.g. DB_STATEMENT_TIMEOUT_MS=5000, DB_SYNCHRONOUS_COMMIT=off
+DB_STATEMENT_TIMEOUT_MS = os.getenv("DB_STATEMENT_TIMEOUT_MS", "")
+DB_SYNCHRONOUS_COMMIT = os.getenv("DB_SYNCHRONOUS_COMMIT", "")
+# Path to a MaxMind GeoLite2-Country .mmdb; when unset (or maxminddb is not
+# installed) country codes come from the ipapi.co HTTP lookup instead.
+GEOIP_DB_PATH = os.getenv("GEOIP_DB_PATH", "")
 SESSION_COOKIE_SECURE = os.getenv("SESSION_COOKIE_SECURE", "false").lower() == "true"
 SESSION_COOKIE_NAME = "session_user_id"
 SESSION_MAX_AGE_SHORT = 60 * 60 * 12
 SESSION_MAX_AGE_LONG = 60 * 60 * 24 * 30
+# Keys the CSRF tokens; must be set (and shared) when running several
+# workers, otherwise each process draws its own random key at startup.
+SESSION_SECRET = os.getenv("SESSION_SECRET", "")
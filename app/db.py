@@ -1,241 +1,487 @@
+import threading
+from contextlib import contextmanager
+
+import orjson
 import psycopg2
-from .config import DATABASE_URL
+import psycopg2.extensions
+import psycopg2.extras
+import psycopg2.pool
+from psycopg2 import sql
+
+from .config import (
+    DATABASE_URL,
+    DB_CONNECT_TIMEOUT,
+    DB_POOL_MAX_SIZE,
+    DB_POOL_MIN_SIZE,
+    DB_PREPARED_STATEMENTS,
+    DB_STATEMENT_TIMEOUT_MS,
+    DB_SYNCHRONOUS_COMMIT,
+)
+
+# Decode json/jsonb columns (e.g. raw_payload) with orjson instead of the stdlib.
+psycopg2.extras.register_default_json(loads=orjson.loads, globally=True)
+psycopg2.extras.register_default_jsonb(loads=orjson.loads, globally=True)
+
+
+def _session_options() -> str:
+    options = []
+    if DB_STATEMENT_TIMEOUT_MS:
+        options.append(f"-c statement_timeout={int(DB_STATEMENT_TIMEOUT_MS)}")
+    if DB_SYNCHRONOUS_COMMIT:
+        options.append(f"-c synchronous_commit={DB_SYNCHRONOUS_COMMIT}")
+    return " ".join(options)
+
+
+class PreparingConnection(psycopg2.extensions.connection):
+    """psycopg2 connection that remembers its server-side prepared statements."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements: set[str] = set()
+
+
+# Applied to every connection: fail fast on an unreachable server and keep idle
+# TLS sessions alive through NAT/load balancers in front of Postgres.
+CONNECT_KWARGS = {
+    "sslmode": "require",
+    "connect_timeout": DB_CONNECT_TIMEOUT,
+    "keepalives": 1,
+    "keepalives_idle": 30,
+    "keepalives_interval": 10,
+    "keepalives_count": 3,
+    "application_name": "cortix-games",
+    "connection_factory": PreparingConnection,
+}
+SESSION_OPTIONS = _session_options()
+if SESSION_OPTIONS:
+    CONNECT_KWARGS["options"] = SESSION_OPTIONS
+
 
 def get_db_connection():
     if not DATABASE_URL:
         raise RuntimeError("DATABASE_URL is not set")
-    return psycopg2.connect(DATABASE_URL, sslmode="require")
+    return psycopg2.connect(DATABASE_URL, **CONNECT_KWARGS)
 
 
-def ensure_math_round1_scores_table():
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cursor:
-            cursor.execute(
-                """
-                CREATE TABLE IF NOT EXISTS math_round1_scores (
-                    id SERIAL PRIMARY KEY,
-                    user_id INTEGER NOT NULL REFERENCES users(id),
-                    score INTEGER NOT NULL,
-                    correct_count INTEGER NOT NULL,
-                    wrong_count INTEGER NOT NULL,
-                    avg_time_ms DOUBLE PRECISION NOT NULL,
-                    min_time_ms DOUBLE PRECISION NOT NULL,
-                    is_valid BOOLEAN NOT NULL DEFAULT TRUE,
-                    raw_payload JSONB,
-                    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-                )
-                """
-            )
-            cursor.execute(
-                """
-                CREATE INDEX IF NOT EXISTS idx_math_round1_scores_score_created_at
-                ON math_round1_scores (score DESC, created_at ASC)
-                """
-            )
-            cursor.execute(
-                """
-                CREATE INDEX IF NOT EXISTS idx_math_round1_scores_user_recent
-                ON math_round1_scores (user_id, created_at DESC)
-                """
-            )
-            cursor.execute(
-                """
-                SELECT EXISTS (
-                    SELECT 1 FROM information_schema.tables
-                    WHERE table_schema = 'public' AND table_name = 'math_scores'
-                )
-                """
-            )
-            old_table_exists = cursor.fetchone()[0]
-
-            if old_table_exists:
-                cursor.execute("SELECT COUNT(*) FROM math_round1_scores")
-                new_count = cursor.fetchone()[0]
-                if new_count == 0:
-                    cursor.execute(
-                        """
-                        INSERT INTO math_round1_scores (
-                            user_id, score, correct_count, wrong_count,
-                            avg_time_ms, min_time_ms, is_valid, raw_payload, created_at
-                        )
-                        SELECT user_id, score, correct_count, wrong_count,
-                               avg_time_ms, min_time_ms, is_valid, raw_payload, created_at
-                        FROM math_scores
-                        """
-                    )
-        conn.commit()
-    finally:
-        conn.close()
+# One pool per process; requests borrow a connection instead of paying for a
+# fresh TCP + TLS + auth handshake every time. ThreadedConnectionPool raises
+# instead of waiting when it runs dry, so the semaphore makes callers queue for
+# a free slot rather than fail under a burst of threadpool requests.
+_pool: psycopg2.pool.ThreadedConnectionPool | None = None
+_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX_SIZE)
+_pool_lock = threading.Lock()
+
 
-def ensure_math_round_mixed_scores_table():
-    conn = get_db_connection()
+def init_db_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            return
+        if not DATABASE_URL:
+            raise RuntimeError("DATABASE_URL is not set")
+        _pool = psycopg2.pool.ThreadedConnectionPool(
+            DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DATABASE_URL, **CONNECT_KWARGS
+        )
+
+
+def close_db_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+
+@contextmanager
+def db_connection(readonly: bool = False):
+    """Borrow a pooled connection for the duration of the ``with`` block.
+
+    Whatever transaction the caller left open is rolled back before the
+    connection goes back to the pool; connections that broke are discarded.
+
+    ``readonly=True`` is for blocks that only SELECT: they run in autocommit,
+    which saves the BEGIN psycopg2 would send first and the ROLLBACK on return.
+    """
+    if _pool is None:
+        init_db_pool()
+    pool = _pool
+    _pool_slots.acquire()
     try:
-        with conn.cursor() as cursor:
-            cursor.execute(
-                """
-                CREATE TABLE IF NOT EXISTS math_round_mixed_scores (
-                    id SERIAL PRIMARY KEY,
-                    user_id INTEGER NOT NULL REFERENCES users(id),
-                    score INTEGER NOT NULL,
-                    correct_count INTEGER NOT NULL,
-                    wrong_count INTEGER NOT NULL,
-                    avg_time_ms DOUBLE PRECISION NOT NULL,
-                    min_time_ms DOUBLE PRECISION NOT NULL,
-                    total_questions INTEGER NOT NULL,
-                    is_valid BOOLEAN NOT NULL DEFAULT TRUE,
-                    raw_payload JSONB,
-                    round_index INTEGER,
-                    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-                    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-                )
-                """
-            )
-            cursor.execute(
-                """
-                ALTER TABLE public.math_round_mixed_scores
-                    ADD COLUMN IF NOT EXISTS round_index INTEGER;
-                """
-            )
-            cursor.execute(
-                """
-                CREATE INDEX IF NOT EXISTS idx_math_round_mixed_scores_score_created_at
-                ON math_round_mixed_scores (score DESC, created_at ASC)
-                """
-            )
-            cursor.execute(
-                """
-                CREATE INDEX IF NOT EXISTS idx_math_round_mixed_scores_user_recent
-                ON math_round_mixed_scores (user_id, created_at DESC)
-                """
-            )
-        conn.commit()
+        conn = pool.getconn()
+        if conn.closed:
+            pool.putconn(conn, close=True)
+            conn = pool.getconn()
+        discard = False
+        if readonly:
+            conn.autocommit = True
+        try:
+            yield conn
+        finally:
+            try:
+                if not conn.closed:
+                    if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                        conn.rollback()
+                    if conn.autocommit:
+                        conn.autocommit = False
+            except psycopg2.Error:
+                discard = True
+            pool.putconn(conn, close=discard or bool(conn.closed))
     finally:
-        conn.close()
+        _pool_slots.release()
 
-def ensure_math_session_scores_table():
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cursor:
+
+def _schema_snapshot(cursor) -> dict[str, set[str]]:
+    """Map every public table to its column names in one catalog query."""
+    cursor.execute(
+        """
+        SELECT table_name, column_name
+        FROM information_schema.columns
+        WHERE table_schema = 'public'
+        """
+    )
+    schema: dict[str, set[str]] = {}
+    for table_name, column_name in cursor.fetchall():
+        schema.setdefault(table_name, set()).add(column_name)
+    return schema
+
+
+def _missing_columns(schema: dict[str, set[str]], table: str, columns) -> list[str]:
+    # Tables absent from the snapshot are about to be created with every column.
+    existing = schema.get(table)
+    if existing is None:
+        return []
+    return [column for column in columns if column not in existing]
+
+
+def execute_prepared(cursor, name: str, statement: str, params: tuple = ()) -> None:
+    """Run a hot query as a named server-side prepared statement.
+
+    ``statement`` uses the usual ``%s`` placeholders. It is PREPAREd the first
+    time a pooled connection sees ``name`` and EXECUTEd from then on, so
+    Postgres skips parsing and planning on repeat calls. With
+    DB_PREPARED_STATEMENTS off (needed behind transaction-mode poolers such as
+    PgBouncer or Supavisor on port 6543) it falls back to a plain execute.
+    """
+    conn = cursor.connection
+    if not DB_PREPARED_STATEMENTS:
+        cursor.execute(statement, params)
+        return
+    if name not in conn.prepared_statements:
+        parts = statement.split("%s")
+        numbered = parts[0] + "".join(
+            f"${index}{part}" for index, part in enumerate(parts[1:], start=1)
+        )
+        cursor.execute(f"PREPARE {name} AS {numbered}")
+        conn.prepared_statements.add(name)
+    if params:
+        cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+    else:
+        cursor.execute(f"EXECUTE {name}")
+
+
+def ensure_math_round1_scores_table(cursor, schema):
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS math_round1_scores (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id),
+            score INTEGER NOT NULL,
+            correct_count INTEGER NOT NULL,
+            wrong_count INTEGER NOT NULL,
+            avg_time_ms DOUBLE PRECISION NOT NULL,
+            min_time_ms DOUBLE PRECISION NOT NULL,
+            is_valid BOOLEAN NOT NULL DEFAULT TRUE,
+            raw_payload JSONB,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+        DROP INDEX IF EXISTS idx_math_round1_scores_score_created_at;
+        -- Covers every leaderboard column but username, so the top 20 come
+        -- from an index-only scan plus the users join.
+        CREATE INDEX IF NOT EXISTS idx_math_round1_scores_valid_leaderboard
+        ON math_round1_scores (score DESC, created_at ASC)
+        INCLUDE (user_id, correct_count, wrong_count, avg_time_ms)
+        WHERE is_valid;
+        CREATE INDEX IF NOT EXISTS idx_math_round1_scores_user_recent
+        ON math_round1_scores (user_id, created_at DESC);
+        """
+    )
+    if "math_scores" in schema:
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM math_round1_scores)")
+        if not cursor.fetchone()[0]:
             cursor.execute(
                 """
-                CREATE TABLE IF NOT EXISTS math_session_scores (
-                    id SERIAL PRIMARY KEY,
-                    user_id INTEGER NOT NULL REFERENCES users(id),
-                    round1_score_id INTEGER NOT NULL REFERENCES math_round1_scores(id),
-                    round2_score_id INTEGER NOT NULL REFERENCES math_round_mixed_scores(id),
-                    round3_score_id INTEGER REFERENCES math_round_mixed_scores(id),
-                    combined_score INTEGER NOT NULL,
-                    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+                INSERT INTO math_round1_scores (
+                    user_id, score, correct_count, wrong_count,
+                    avg_time_ms, min_time_ms, is_valid, raw_payload, created_at
                 )
+                SELECT user_id, score, correct_count, wrong_count,
+                       avg_time_ms, min_time_ms, is_valid, raw_payload, created_at
+                FROM math_scores
                 """
             )
-            cursor.execute(
-                """
-                ALTER TABLE public.math_session_scores
-                    ADD COLUMN IF NOT EXISTS round3_score_id INTEGER REFERENCES math_round_mixed_scores(id);
-                """
-            )
-            cursor.execute(
-                """
-                CREATE INDEX IF NOT EXISTS idx_math_sessions_user_recent
-                ON math_session_scores (user_id, created_at DESC)
-                """
-            )
-        conn.commit()
-    finally:
-        conn.close()
 
-def ensure_user_profile_columns():
+def ensure_math_round_mixed_scores_table(cursor, schema):
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS math_round_mixed_scores (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id),
+            score INTEGER NOT NULL,
+            correct_count INTEGER NOT NULL,
+            wrong_count INTEGER NOT NULL,
+            avg_time_ms DOUBLE PRECISION NOT NULL,
+            min_time_ms DOUBLE PRECISION NOT NULL,
+            total_questions INTEGER NOT NULL,
+            is_valid BOOLEAN NOT NULL DEFAULT TRUE,
+            raw_payload JSONB,
+            round_index INTEGER,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+        DROP INDEX IF EXISTS idx_math_round_mixed_scores_score_created_at;
+        CREATE INDEX IF NOT EXISTS idx_math_round_mixed_scores_valid_leaderboard
+        ON math_round_mixed_scores (score DESC, created_at ASC)
+        INCLUDE (user_id, correct_count, wrong_count, avg_time_ms)
+        WHERE is_valid;
+        CREATE INDEX IF NOT EXISTS idx_math_round_mixed_scores_user_recent
+        ON math_round_mixed_scores (user_id, created_at DESC);
+        """
+    )
+    if _missing_columns(schema, "math_round_mixed_scores", ["round_index"]):
+        cursor.execute(
+            """
+            ALTER TABLE public.math_round_mixed_scores
+                ADD COLUMN IF NOT EXISTS round_index INTEGER;
+            """
+        )
+    # Per-round leaderboards; legacy rows without a round_index count as round 2.
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_math_round_mixed_scores_valid_round_leaderboard
+        ON math_round_mixed_scores ((COALESCE(round_index, 2)), score DESC, created_at ASC)
+        INCLUDE (user_id, correct_count, wrong_count, avg_time_ms)
+        WHERE is_valid;
+        """
+    )
+
+def ensure_math_session_scores_table(cursor, schema):
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS math_session_scores (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id),
+            round1_score_id INTEGER NOT NULL REFERENCES math_round1_scores(id),
+            round2_score_id INTEGER NOT NULL REFERENCES math_round_mixed_scores(id),
+            round3_score_id INTEGER REFERENCES math_round_mixed_scores(id),
+            combined_score INTEGER NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+        CREATE INDEX IF NOT EXISTS idx_math_sessions_user_recent
+        ON math_session_scores (user_id, created_at DESC);
+        """
+    )
+    if _missing_columns(schema, "math_session_scores", ["round3_score_id"]):
+        cursor.execute(
+            """
+            ALTER TABLE public.math_session_scores
+                ADD COLUMN IF NOT EXISTS round3_score_id INTEGER REFERENCES math_round_mixed_scores(id);
+            """
+        )
+
+USER_PROFILE_COLUMNS = {
+    "sex": "text",
+    "age_band": "text",
+    "handedness": "text",
+    "is_public": "boolean NOT NULL DEFAULT true",
+    "created_at": "timestamptz NOT NULL DEFAULT now()",
+}
+
+
+def ensure_user_profile_columns(cursor, schema):
     """Add optional profile columns to the users table if they are missing."""
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cursor:
-            cursor.execute(
-                """
-                ALTER TABLE public.users
-                    ADD COLUMN IF NOT EXISTS sex text,
-                    ADD COLUMN IF NOT EXISTS age_band text,
-                    ADD COLUMN IF NOT EXISTS handedness text,
-                    ADD COLUMN IF NOT EXISTS is_public boolean NOT NULL DEFAULT true,
-                    ADD COLUMN IF NOT EXISTS created_at timestamptz NOT NULL DEFAULT now();
-                """
+    # Only ALTER when something is missing: even a no-op ADD COLUMN IF NOT
+    # EXISTS takes an ACCESS EXCLUSIVE lock on users.
+    missing = _missing_columns(schema, "users", USER_PROFILE_COLUMNS)
+    if missing:
+        cursor.execute(
+            "ALTER TABLE public.users "
+            + ", ".join(
+                f"ADD COLUMN IF NOT EXISTS {column} {USER_PROFILE_COLUMNS[column]}"
+                for column in missing
             )
-            cursor.execute(
-                """
-                UPDATE public.users
-                SET sex = COALESCE(sex, CASE gender WHEN 'female' THEN 'female' WHEN 'male' THEN 'male' ELSE 'prefer_not_to_say' END)
-                WHERE (sex IS NULL OR sex = '') AND gender IS NOT NULL;
-                """
-            )
-            cursor.execute(
-                """
-                UPDATE public.users
-                SET handedness = CASE handedness WHEN 'ambi' THEN 'ambidextrous' ELSE handedness END
-                WHERE handedness IS NOT NULL;
-                """
-            )
-            cursor.execute(
-                """
-                UPDATE public.users
-                SET age_band = age_range
-                WHERE (age_band IS NULL OR age_band = '') AND age_range IS NOT NULL;
-                """
-            )
-        conn.commit()
-    finally:
-        conn.close()
+        )
+    cursor.execute(
+        """
+        UPDATE public.users
+        SET sex = COALESCE(sex, CASE gender WHEN 'female' THEN 'female' WHEN 'male' THEN 'male' ELSE 'prefer_not_to_say' END)
+        WHERE (sex IS NULL OR sex = '') AND gender IS NOT NULL;
+        UPDATE public.users
+        SET handedness = 'ambidextrous'
+        WHERE handedness = 'ambi';
+        UPDATE public.users
+        SET age_band = age_range
+        WHERE (age_band IS NULL OR age_band = '') AND age_range IS NOT NULL;
+        """
+    )
 
-def ensure_memory_score_payload_column():
+def ensure_users_username_unique(cursor, schema):
+    """Guarantee the unique index on users.username.
+
+    Signup relies on it: a concurrent duplicate fails the INSERT with
+    UniqueViolation, which the handler reports as "Username is already taken."
+
+    Uses the name Postgres gives an inline UNIQUE constraint, so databases that
+    already have one do not get a duplicate index.
+    """
+    cursor.execute(
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS users_username_key
+        ON public.users (username)
+        """
+    )
+
+def ensure_memory_score_payload_column(cursor, schema):
     """Add a payload column to memory_scores to capture richer analytics."""
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cursor:
+    if _missing_columns(schema, "memory_scores", ["raw_payload"]):
+        cursor.execute(
+            """
+            ALTER TABLE public.memory_scores
+                ADD COLUMN IF NOT EXISTS raw_payload jsonb;
+            """
+        )
+
+def ensure_score_created_at_defaults(cursor, schema):
+    """Let Postgres stamp created_at on the reaction and memory score tables."""
+    for table in ("reaction_scores", "memory_scores"):
+        if "created_at" in schema.get(table, ()):
             cursor.execute(
-                """
-                ALTER TABLE public.memory_scores
-                    ADD COLUMN IF NOT EXISTS raw_payload jsonb;
-                """
+                sql.SQL("ALTER TABLE public.{} ALTER COLUMN created_at SET DEFAULT now()").format(
+                    sql.Identifier(table)
+                )
             )
-        conn.commit()
-    finally:
-        conn.close()
 
-def ensure_achievements_tables():
+def ensure_achievements_tables(cursor, schema):
     """Create achievements tables if they do not exist."""
-    conn = get_db_connection()
-    try:
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS public.achievements (
+            id serial PRIMARY KEY,
+            code text UNIQUE NOT NULL,
+            name text NOT NULL,
+            description text NOT NULL,
+            category text NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS public.user_achievements (
+            id serial PRIMARY KEY,
+            user_id integer NOT NULL REFERENCES public.users(id) ON DELETE CASCADE,
+            achievement_id integer NOT NULL REFERENCES public.achievements(id) ON DELETE CASCADE,
+            earned_at timestamptz NOT NULL DEFAULT now(),
+            UNIQUE (user_id, achievement_id)
+        );
+        """
+    )
+
+def ensure_score_history_indexes(cursor, schema):
+    """Index per-user history on the reaction and memory score tables."""
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_reaction_scores_user_recent
+        ON reaction_scores (user_id, created_at DESC);
+        CREATE INDEX IF NOT EXISTS idx_memory_scores_user_recent
+        ON memory_scores (user_id, created_at DESC);
+        """
+    )
+
+def ensure_best_score_indexes(cursor, schema):
+    """Index each user's scores by value so per-user bests are an index probe."""
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_reaction_scores_user_score
+        ON reaction_scores (user_id, score DESC);
+        CREATE INDEX IF NOT EXISTS idx_memory_scores_user_total
+        ON memory_scores (user_id, total_score DESC);
+        CREATE INDEX IF NOT EXISTS idx_math_round1_scores_user_score
+        ON math_round1_scores (user_id, score DESC);
+        CREATE INDEX IF NOT EXISTS idx_math_round_mixed_scores_user_round_score
+        ON math_round_mixed_scores (user_id, round_index, score DESC);
+        CREATE INDEX IF NOT EXISTS idx_math_sessions_user_combined
+        ON math_session_scores (user_id, combined_score DESC);
+        """
+    )
+
+def analyze_unanalyzed_tables(cursor, schema):
+    """ANALYZE tables the planner has no statistics for yet.
+
+    Autovacuum keeps statistics fresh once a table has seen enough writes, but
+    a freshly created or freshly backfilled table can sit unanalyzed long
+    enough for the leaderboard queries to pick a bad plan. Tables that already
+    have statistics are left to autovacuum, so this is a no-op on a warm DB.
+    """
+    cursor.execute(
+        """
+        SELECT relname
+        FROM pg_stat_user_tables
+        WHERE schemaname = 'public'
+          AND last_analyze IS NULL
+          AND last_autoanalyze IS NULL
+        """
+    )
+    for (table_name,) in cursor.fetchall():
+        cursor.execute(sql.SQL("ANALYZE public.{}").format(sql.Identifier(table_name)))
+
+# Bump whenever an ensure_* step changes; startup skips all DDL while the
+# database already records this version.
+SCHEMA_VERSION = "6"
+# Arbitrary key for the advisory lock that serialises migrations.
+SCHEMA_LOCK_ID = 0x434F5254
+
+
+def _stored_schema_version(cursor) -> str | None:
+    cursor.execute("SELECT to_regclass('public.schema_meta') IS NOT NULL")
+    if not cursor.fetchone()[0]:
+        return None
+    cursor.execute("SELECT value FROM schema_meta WHERE key = 'version'")
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def init_db_schema():
+    # Every worker runs this at startup. A version check keeps the steady
+    # state to two catalog reads; when a migration is due, the advisory lock
+    # lets one worker apply it while the others wait and then see it done.
+    with db_connection(readonly=True) as conn:
         with conn.cursor() as cursor:
+            if _stored_schema_version(cursor) == SCHEMA_VERSION:
+                return
+
+    # All DDL and backfills share one connection and commit once, so startup
+    # pays for a single transaction instead of one per step.
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (SCHEMA_LOCK_ID,))
+            if _stored_schema_version(cursor) == SCHEMA_VERSION:
+                return
+            schema = _schema_snapshot(cursor)
+            ensure_math_round1_scores_table(cursor, schema)
+            ensure_math_round_mixed_scores_table(cursor, schema)
+            ensure_math_session_scores_table(cursor, schema)
+            ensure_user_profile_columns(cursor, schema)
+            ensure_users_username_unique(cursor, schema)
+            ensure_memory_score_payload_column(cursor, schema)
+            ensure_score_created_at_defaults(cursor, schema)
+            ensure_achievements_tables(cursor, schema)
+            ensure_score_history_indexes(cursor, schema)
+            ensure_best_score_indexes(cursor, schema)
+            analyze_unanalyzed_tables(cursor, schema)
             cursor.execute(
                 """
-                CREATE TABLE IF NOT EXISTS public.achievements (
-                    id serial PRIMARY KEY,
-                    code text UNIQUE NOT NULL,
-                    name text NOT NULL,
-                    description text NOT NULL,
-                    category text NOT NULL
-                );
-                """
-            )
-            cursor.execute(
-                """
-                CREATE TABLE IF NOT EXISTS public.user_achievements (
-                    id serial PRIMARY KEY,
-                    user_id integer NOT NULL REFERENCES public.users(id) ON DELETE CASCADE,
-                    achievement_id integer NOT NULL REFERENCES public.achievements(id) ON DELETE CASCADE,
-                    earned_at timestamptz NOT NULL DEFAULT now(),
-                    UNIQUE (user_id, achievement_id)
+                CREATE TABLE IF NOT EXISTS schema_meta (
+                    key text PRIMARY KEY,
+                    value text NOT NULL
                 );
-                """
+                INSERT INTO schema_meta (key, value) VALUES ('version', %s)
+                ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value;
+                """,
+                (SCHEMA_VERSION,),
             )
         conn.commit()
-    finally:
-        conn.close()
-
-def init_db_schema():
-    ensure_math_round1_scores_table()
-    ensure_math_round_mixed_scores_table()
-    ensure_math_session_scores_table()
-    ensure_user_profile_columns()
-    ensure_memory_score_payload_column()
-    ensure_achievements_tables()
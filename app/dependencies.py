@@ -1,8 +1,20 @@
+import jinja2
 from fastapi.templating import Jinja2Templates
-from .config import TEMPLATE_DIRS
+from .config import TEMPLATE_DIRS, TEMPLATES_AUTO_RELOAD
 
 # Shared template loader
 templates = Jinja2Templates(directory=[str(p) for p in TEMPLATE_DIRS])
+# Templates only change on deploy; skip the per-render mtime stat unless asked.
+templates.env.auto_reload = TEMPLATES_AUTO_RELOAD
+# Compiled template bytecode is shared on disk, so restarts and the other
+# workers load it instead of re-parsing every template.
+templates.env.bytecode_cache = jinja2.FileSystemBytecodeCache()
+
+
+def preload_templates() -> None:
+    """Compile every template once so the first request to each page is warm."""
+    for name in templates.env.list_templates(extensions=["html"]):
+        templates.env.get_template(name)
 
 
 def get_templates():
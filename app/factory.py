@@ -1,12 +1,21 @@
-from fastapi import FastAPI
+import logging
+
+import orjson
+import psycopg2
+from fastapi import FastAPI, Request, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 
 from .config import STATIC_DIR
 from .achievements import seed_achievements
 from .db import (
-    init_db_schema
+    close_db_pool,
+    init_db_pool,
+    init_db_schema,
 )
-from .dependencies import templates
+from .dependencies import preload_templates
+from .services.geo import close_geo_client
 from .routers import (
     auth,
     pages,
@@ -17,8 +26,26 @@ from .routers import (
     maths_game,
 )
 
+logger = logging.getLogger(__name__)
+
+# Encoded once; database failures tend to arrive in bursts (pool exhausted,
+# server restarting), so the error path should not do any extra work.
+DB_ERROR_BODY = orjson.dumps({"status": "error", "message": "database error"})
+
+
+async def database_error_handler(request: Request, exc: psycopg2.Error) -> Response:
+    # Details stay in the server log; clients get a fixed, non-leaky body.
+    logger.error("Database error on %s %s: %s", request.method, request.url.path, exc)
+    return Response(content=DB_ERROR_BODY, status_code=500, media_type="application/json")
+
+
 def create_app() -> FastAPI:
-    app = FastAPI()
+    # orjson encodes responses several times faster than the stdlib encoder.
+    app = FastAPI(default_response_class=ORJSONResponse)
+    app.add_exception_handler(psycopg2.Error, database_error_handler)
+    # Leaderboard JSON repeats usernames and country codes row after row and
+    # shrinks several-fold; small bodies are not worth the CPU.
+    app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
 
     # Static + templates (whatever you already had)
     app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -26,8 +53,15 @@ def create_app() -> FastAPI:
     # Run DB + achievements init on startup
     @app.on_event("startup")
     def startup() -> None:
+        init_db_pool()
         init_db_schema()
         seed_achievements()
+        preload_templates()
+
+    @app.on_event("shutdown")
+    async def shutdown() -> None:
+        close_db_pool()
+        await close_geo_client()
 
     # Include routers
     app.include_router(pages.router)
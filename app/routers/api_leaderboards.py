@@ -1,36 +1,39 @@
-import re
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Request
 
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import JSONResponse
-
-from app.db import get_db_connection
-from app.security import get_current_user
+from app.db import db_connection
+from app.security import assert_valid_username, get_current_user
+from app.services.leaderboards import cache_leaderboard, get_cached_leaderboard
+from app.utils.http import etag_json_response
 
 router = APIRouter()
 
-USERNAME_RE = re.compile(r"^[A-Za-z0-9_]{3,20}$")
 
+def _last_updated(scores: list) -> str | None:
+    # last_played (each player's newest score) is the final column of both
+    # leaderboards, so the overall newest is already in hand; no second query.
+    newest = max((row[-1] for row in scores), default=None)
+    return newest.date().isoformat() if newest else None
 
-def assert_valid_username(username: str) -> None:
-    if not USERNAME_RE.match(username or ""):
-        raise HTTPException(status_code=400, detail="Invalid username")
-    
 
 @router.get("/api/leaderboard/reaction-game")
-async def reaction_leaderboard_api(current_user=Depends(get_current_user)):
+def reaction_leaderboard_api(request: Request, current_user=Depends(get_current_user)):
     if not current_user:
         raise HTTPException(status_code=401, detail="Sign in required")
 
-    conn = get_db_connection()
-    try:
+    body = get_cached_leaderboard("reaction")
+    if body is not None:
+        return etag_json_response(request, body)
+
+    with db_connection(readonly=True) as conn:
         with conn.cursor() as cursor:
             cursor.execute(
                 """
                 SELECT
                     u.username,
                     u.country_code,
-                    MAX(r.score) AS best_score,
-                    AVG(r.average_time_ms) AS avg_time,
+                    MAX(r.score)::float8 AS best_score,
+                    AVG(r.average_time_ms)::float8 AS avg_time,
                     MAX(r.created_at) AS last_played
                 FROM reaction_scores r
                 JOIN users u ON u.id = r.user_id
@@ -38,48 +41,37 @@ async def reaction_leaderboard_api(current_user=Depends(get_current_user)):
                 ORDER BY best_score DESC
                 """
             )
-            rows = cursor.fetchall()
-
-            scores = []
-            for username, country_code, best_score, avg_time, last_played in rows:
-                scores.append([
-                    username,
-                    country_code,
-                    float(best_score) if best_score is not None else None,
-                    float(avg_time) if avg_time is not None else None,
-                    last_played.isoformat() if last_played else None,
-                ])
-
-            cursor.execute("SELECT MAX(created_at) FROM reaction_scores")
-            last_updated_row = cursor.fetchone()
-            last_updated = (
-                last_updated_row[0].date().isoformat()
-                if last_updated_row and last_updated_row[0]
-                else None
-            )
+            # Columns are already JSON-ready (floats cast in SQL, orjson
+            # writes the timestamps), so rows go to the encoder as-is.
+            scores = cursor.fetchall()
 
-        return JSONResponse(content={"scores": scores, "last_updated": last_updated})
-    finally:
-        conn.close()
+    last_updated = _last_updated(scores)
+
+    body = orjson.dumps({"scores": scores, "last_updated": last_updated})
+    cache_leaderboard("reaction", body)
+    return etag_json_response(request, body)
 
 
 @router.get("/api/leaderboard/memory-game")
-async def memory_leaderboard_api(current_user=Depends(get_current_user)):
+def memory_leaderboard_api(request: Request, current_user=Depends(get_current_user)):
     if not current_user:
         raise HTTPException(status_code=401, detail="Sign in required")
 
-    conn = get_db_connection()
-    try:
+    body = get_cached_leaderboard("memory")
+    if body is not None:
+        return etag_json_response(request, body)
+
+    with db_connection(readonly=True) as conn:
         with conn.cursor() as cursor:
             cursor.execute(
                 """
                 SELECT
                     u.username,
                     u.country_code,
-                    MAX(m.total_score) AS best_total,
-                    MAX(m.round1_score) AS best_r1,
-                    MAX(m.round2_score) AS best_r2,
-                    MAX(m.round3_score) AS best_r3,
+                    MAX(m.total_score)::float8 AS best_total,
+                    MAX(m.round1_score)::float8 AS best_r1,
+                    MAX(m.round2_score)::float8 AS best_r2,
+                    MAX(m.round3_score)::float8 AS best_r3,
                     MAX(m.created_at) AS last_played
                 FROM memory_scores m
                 JOIN users u ON u.id = m.user_id
@@ -87,52 +79,43 @@ async def memory_leaderboard_api(current_user=Depends(get_current_user)):
                 ORDER BY best_total DESC
                 """
             )
-            rows = cursor.fetchall()
-
-            scores = []
-            for (
-                username,
-                country_code,
-                best_total,
-                best_r1,
-                best_r2,
-                best_r3,
-                last_played,
-            ) in rows:
-                scores.append([
-                    username,
-                    country_code,
-                    float(best_total) if best_total is not None else None,
-                    float(best_r1) if best_r1 is not None else None,
-                    float(best_r2) if best_r2 is not None else None,
-                    float(best_r3) if best_r3 is not None else None,
-                    last_played.isoformat() if last_played else None,
-                ])
-
-            cursor.execute("SELECT MAX(created_at) FROM memory_scores")
-            last_updated_row = cursor.fetchone()
-            last_updated = (
-                last_updated_row[0].date().isoformat()
-                if last_updated_row and last_updated_row[0]
-                else None
-            )
+            scores = cursor.fetchall()
 
-        return JSONResponse(content={"scores": scores, "last_updated": last_updated})
-    finally:
-        conn.close()
+    last_updated = _last_updated(scores)
+
+    body = orjson.dumps({"scores": scores, "last_updated": last_updated})
+    cache_leaderboard("memory", body)
+    return etag_json_response(request, body)
 
 
 @router.get("/api/my-best-scores")
-async def my_best_scores(username: str):
+def my_best_scores(username: str):
     """
     Used on landing page to show a user's 'best ever' scores across games.
     """
     assert_valid_username(username)
 
-    conn = get_db_connection()
-    try:
+    with db_connection(readonly=True) as conn:
         with conn.cursor() as cursor:
-            cursor.execute("SELECT id FROM users WHERE username = %s", (username,))
+            # One round trip: each MAX is a probe on the per-user best-score
+            # indexes, so there is nothing to gain from keeping copies of
+            # the bests on users.
+            cursor.execute(
+                """
+                SELECT
+                    (SELECT MAX(score) FROM reaction_scores WHERE user_id = u.id),
+                    (SELECT MAX(total_score) FROM memory_scores WHERE user_id = u.id),
+                    GREATEST(
+                        COALESCE((SELECT MAX(score) FROM math_round1_scores WHERE user_id = u.id), 0),
+                        COALESCE((SELECT MAX(score) FROM math_round_mixed_scores WHERE user_id = u.id), 0),
+                        COALESCE((SELECT MAX(score) FROM math_scores WHERE user_id = u.id), 0),
+                        COALESCE((SELECT MAX(combined_score) FROM math_session_scores WHERE user_id = u.id), 0)
+                    )
+                FROM users u
+                WHERE u.username = %s
+                """,
+                (username,),
+            )
             row = cursor.fetchone()
             if not row:
                 return {
@@ -141,33 +124,7 @@ async def my_best_scores(username: str):
                     "memory_best": None,
                     "arithmetic_best": None,
                 }
-
-            user_id = row[0]
-
-            cursor.execute(
-                "SELECT MAX(score) FROM reaction_scores WHERE user_id = %s",
-                (user_id,),
-            )
-            reaction_best = cursor.fetchone()[0]
-
-            cursor.execute(
-                "SELECT MAX(total_score) FROM memory_scores WHERE user_id = %s",
-                (user_id,),
-            )
-            memory_best = cursor.fetchone()[0]
-
-            cursor.execute(
-                """
-                SELECT GREATEST(
-                    COALESCE((SELECT MAX(score) FROM math_round1_scores WHERE user_id = %s), 0),
-                    COALESCE((SELECT MAX(score) FROM math_round_mixed_scores WHERE user_id = %s), 0),
-                    COALESCE((SELECT MAX(score) FROM math_scores WHERE user_id = %s), 0),
-                    COALESCE((SELECT MAX(combined_score) FROM math_session_scores WHERE user_id = %s), 0)
-                )
-                """,
-                (user_id, user_id, user_id, user_id),
-            )
-            arithmetic_best = cursor.fetchone()[0]
+            reaction_best, memory_best, arithmetic_best = row
 
         return {
             "username": username,
@@ -175,5 +132,3 @@ async def my_best_scores(username: str):
             "memory_best": memory_best,
             "arithmetic_best": arithmetic_best if arithmetic_best != 0 else None,
         }
-    finally:
-        conn.close()
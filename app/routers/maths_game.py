@@ -1,23 +1,114 @@
 from datetime import datetime
 
+import orjson
 import psycopg2.extras
 from fastapi import APIRouter, Depends, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
+from starlette.concurrency import run_in_threadpool
 
 from app.security import get_current_user, csrf_protected
-from app.db import get_db_connection
+from app.db import db_connection, execute_prepared
+from app.utils.http import etag_json_response, json_body, read_json_object
 from app.utils.validation import enforce_range
 from app.achievements import check_and_award_achievements
+from app.schemas import MathSessionIn
+from app.services.leaderboards import (
+    cache_leaderboard,
+    get_cached_leaderboard,
+    invalidate_leaderboard,
+)
 from app.services.maths_game import calculate_arithmetic_score
 
 router = APIRouter()
 
+# Request fields kept in raw_payload for insights and auditing. Counts and
+# timings already have their own columns, and the per-operator breakdowns
+# can be rebuilt from the per-question entries.
+ROUND1_PAYLOAD_FIELDS = (
+    "per_question_times",
+    "total_time_ms",
+    "run_duration_ms",
+    "ended_by_timeout",
+    "timed_out_count",
+    "version",
+)
+ROUND_MIXED_PAYLOAD_FIELDS = (
+    "per_question",
+    "ended_by_timeout",
+    "timed_out_count",
+    "score_client",
+)
+
+
+# Column order of the math leaderboard SELECTs; rows are zipped onto these.
+LEADERBOARD_FIELDS = (
+    "username",
+    "score",
+    "correct_count",
+    "wrong_count",
+    "avg_time_ms",
+    "created_at",
+)
+
+
+# round_index query values the mixed-round leaderboard accepts.
+MIXED_ROUND_INDEXES = {"2": 2, "3": 3}
+
+
+def _audit_payload(data: dict, fields: tuple, **extra) -> dict:
+    payload = {field: data[field] for field in fields if field in data}
+    payload.update(extra)
+    return payload
+
+
+def _store_round1_score(
+    user_id, score_value, correct_count, wrong_count, avg_time_ms, min_time_ms, is_valid, raw_payload
+):
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            execute_prepared(
+                cursor,
+                "insert_math_round1_score",
+                """
+                INSERT INTO math_round1_scores (
+                    user_id, score, correct_count, wrong_count,
+                    avg_time_ms, min_time_ms, is_valid, raw_payload
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                RETURNING id, created_at
+                """,
+                (
+                    user_id,
+                    score_value,
+                    correct_count,
+                    wrong_count,
+                    avg_time_ms,
+                    min_time_ms,
+                    is_valid,
+                    psycopg2.extras.Json(raw_payload),
+                ),
+            )
+            inserted = cursor.fetchone()
+            new_id = inserted[0]
+        check_and_award_achievements(
+            conn,
+            user_id,
+            "math_round1",
+            {
+                "avg_time_ms": avg_time_ms,
+                "wrong_count": wrong_count,
+                "correct_count": correct_count,
+                "created_at": inserted[1] if inserted else None,
+            },
+        )
+        conn.commit()
+    return new_id
+
 
 async def save_round1_score(request: Request, current_user):
     if not current_user:
         raise HTTPException(status_code=401, detail="Login required")
 
-    data = await request.json()
+    data = await read_json_object(request)
     correct_count = int(data.get("correct_count") or 0)
     wrong_count = int(data.get("wrong_count") or 0)
     avg_time_ms = float(data.get("avg_time_ms") or 0)
@@ -37,13 +128,14 @@ async def save_round1_score(request: Request, current_user):
     enforce_range(min_time_ms, 50, 5000, "Minimum time")
 
     score_value = calculate_arithmetic_score(
-        correct_count, wrong_count, avg_time_ms, per_question_times
+        correct_count, wrong_count, per_question_times
     )
 
     enforce_range(score_value, -2000, 50000, "Score")
 
-    raw_payload = data.copy()
-    raw_payload.update({"score": score_value, "is_valid": is_valid})
+    raw_payload = _audit_payload(
+        data, ROUND1_PAYLOAD_FIELDS, score=score_value, is_valid=is_valid
+    )
 
     response_payload = {
         "status": "success",
@@ -62,36 +154,68 @@ async def save_round1_score(request: Request, current_user):
     if not current_user:
         response_payload["round1_score_id"] = None
         response_payload["message"] = "Login to save your Round 1 score"
-        return JSONResponse(content=response_payload)
+        return ORJSONResponse(content=response_payload)
+
+    new_id = await run_in_threadpool(
+        _store_round1_score,
+        current_user["id"],
+        score_value,
+        correct_count,
+        wrong_count,
+        avg_time_ms,
+        min_time_ms,
+        is_valid,
+        raw_payload,
+    )
+    invalidate_leaderboard("math_round1")
 
-    conn = get_db_connection()
-    try:
+    response_payload["round1_score_id"] = new_id
+    return ORJSONResponse(content=response_payload)
+
+
+def _store_round_mixed_score(
+    user_id,
+    round_index,
+    score_value,
+    correct_count,
+    wrong_count,
+    avg_time_ms,
+    min_time_ms,
+    total_questions,
+    is_valid,
+    raw_payload,
+):
+    with db_connection() as conn:
         with conn.cursor() as cursor:
-            cursor.execute(
+            execute_prepared(
+                cursor,
+                "insert_math_round_mixed_score",
                 """
-                INSERT INTO math_round1_scores (
+                INSERT INTO math_round_mixed_scores (
                     user_id, score, correct_count, wrong_count,
-                    avg_time_ms, min_time_ms, is_valid, raw_payload
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                    avg_time_ms, min_time_ms, total_questions, is_valid, raw_payload, round_index, updated_at
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
                 RETURNING id, created_at
                 """,
                 (
-                    current_user["id"],
+                    user_id,
                     score_value,
                     correct_count,
                     wrong_count,
                     avg_time_ms,
                     min_time_ms,
+                    total_questions,
                     is_valid,
                     psycopg2.extras.Json(raw_payload),
+                    round_index,
                 ),
             )
             inserted = cursor.fetchone()
             new_id = inserted[0]
         check_and_award_achievements(
             conn,
-            current_user["id"],
-            "math_round1",
+            user_id,
+            "math_round2" if round_index == 2 else "math_round3",
             {
                 "avg_time_ms": avg_time_ms,
                 "wrong_count": wrong_count,
@@ -100,11 +224,7 @@ async def save_round1_score(request: Request, current_user):
             },
         )
         conn.commit()
-    finally:
-        conn.close()
-
-    response_payload["round1_score_id"] = new_id
-    return JSONResponse(content=response_payload)
+    return new_id
 
 
 async def _save_round_mixed_score(
@@ -112,7 +232,7 @@ async def _save_round_mixed_score(
     current_user,
     round_index: int,
 ):
-    data = await request.json()
+    data = await read_json_object(request)
     correct_count = int(data.get("correct_count") or 0)
     wrong_count = int(data.get("wrong_count") or 0)
     avg_time_ms = float(data.get("avg_time_ms") or 0)
@@ -136,14 +256,17 @@ async def _save_round_mixed_score(
     enforce_range(min_time_ms, 50, 5000, "Minimum time")
 
     score_value = calculate_arithmetic_score(
-        correct_count, wrong_count, avg_time_ms, per_question
+        correct_count, wrong_count, per_question
     )
 
     enforce_range(score_value, -2000, 50000, "Score")
 
-    raw_payload = data.copy()
-    raw_payload.update(
-        {"score": score_value, "is_valid": is_valid, "round_index": round_index}
+    raw_payload = _audit_payload(
+        data,
+        ROUND_MIXED_PAYLOAD_FIELDS,
+        score=score_value,
+        is_valid=is_valid,
+        round_index=round_index,
     )
 
     score_key = "round2_score" if round_index == 2 else "round3_score"
@@ -159,46 +282,20 @@ async def _save_round_mixed_score(
         response_payload["message"] = f"Login to save your Round {round_index} score"
         return response_payload
 
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cursor:
-            cursor.execute(
-                """
-                INSERT INTO math_round_mixed_scores (
-                    user_id, score, correct_count, wrong_count,
-                    avg_time_ms, min_time_ms, total_questions, is_valid, raw_payload, round_index, updated_at
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
-                RETURNING id, created_at
-                """,
-                (
-                    current_user["id"],
-                    score_value,
-                    correct_count,
-                    wrong_count,
-                    avg_time_ms,
-                    min_time_ms,
-                    total_questions,
-                    is_valid,
-                    psycopg2.extras.Json(raw_payload),
-                    round_index,
-                ),
-            )
-            inserted = cursor.fetchone()
-            new_id = inserted[0]
-        check_and_award_achievements(
-            conn,
-            current_user["id"],
-            "math_round2" if round_index == 2 else "math_round3",
-            {
-                "avg_time_ms": avg_time_ms,
-                "wrong_count": wrong_count,
-                "correct_count": correct_count,
-                "created_at": inserted[1] if inserted else None,
-            },
-        )
-        conn.commit()
-    finally:
-        conn.close()
+    new_id = await run_in_threadpool(
+        _store_round_mixed_score,
+        current_user["id"],
+        round_index,
+        score_value,
+        correct_count,
+        wrong_count,
+        avg_time_ms,
+        min_time_ms,
+        total_questions,
+        is_valid,
+        raw_payload,
+    )
+    invalidate_leaderboard("math_round_mixed")
 
     response_payload["round_mixed_score_id"] = new_id
     return response_payload
@@ -228,7 +325,7 @@ async def submit_round2_score_endpoint(
     _=Depends(csrf_protected),
 ):
     response = await save_round2_score(request, current_user)
-    return JSONResponse(content=response)
+    return ORJSONResponse(content=response)
 
 
 @router.post("/api/math-game/round3/submit")
@@ -238,39 +335,15 @@ async def submit_round3_score_endpoint(
     _=Depends(csrf_protected),
 ):
     response = await save_round3_score(request, current_user)
-    return JSONResponse(content=response)
-
+    return ORJSONResponse(content=response)
 
-@router.post("/api/math-game/session/submit")
-async def submit_math_session(
-    request: Request,
-    current_user=Depends(get_current_user),
-    _=Depends(csrf_protected),
-):
-    data = await request.json()
-    round1_score_id = int(data.get("round1_score_id") or 0)
-    round2_score_id = int(data.get("round2_score_id") or 0)
-    round3_score_id = int(data.get("round3_score_id") or 0)
-    combined_score = int(data.get("combined_score") or 0)
-
-    if not (round1_score_id and round2_score_id and round3_score_id):
-        raise HTTPException(status_code=400, detail="Round IDs required")
-    if combined_score < 0 or combined_score > 200000:
-        raise HTTPException(status_code=422, detail="Combined score out of range")
-
-    if not current_user:
-        return JSONResponse(
-            content={
-                "status": "success",
-                "message": "Login to save your math session",
-                "combined_score": combined_score,
-            }
-        )
 
-    conn = get_db_connection()
-    try:
+def _store_math_session(user_id, round1_score_id, round2_score_id, round3_score_id, combined_score):
+    with db_connection() as conn:
         with conn.cursor() as cursor:
-            cursor.execute(
+            execute_prepared(
+                cursor,
+                "insert_math_session",
                 """
                 INSERT INTO math_session_scores (
                     user_id, round1_score_id, round2_score_id, round3_score_id, combined_score
@@ -278,7 +351,7 @@ async def submit_math_session(
                 RETURNING id, created_at
                 """,
                 (
-                    current_user["id"],
+                    user_id,
                     round1_score_id,
                     round2_score_id,
                     round3_score_id or None,
@@ -289,7 +362,7 @@ async def submit_math_session(
             new_id = inserted[0]
         check_and_award_achievements(
             conn,
-            current_user["id"],
+            user_id,
             "math_session",
             {
                 "combined_score": combined_score,
@@ -297,20 +370,58 @@ async def submit_math_session(
             },
         )
         conn.commit()
-    finally:
-        conn.close()
+    return new_id
+
+
+@router.post("/api/math-game/session/submit")
+async def submit_math_session(
+    request: Request,
+    current_user=Depends(get_current_user),
+    _=Depends(csrf_protected),
+    payload: MathSessionIn = Depends(json_body(MathSessionIn)),
+):
+    round1_score_id = payload.round1_score_id or 0
+    round2_score_id = payload.round2_score_id or 0
+    round3_score_id = payload.round3_score_id or 0
+    combined_score = payload.combined_score or 0
+
+    if not (round1_score_id and round2_score_id and round3_score_id):
+        raise HTTPException(status_code=400, detail="Round IDs required")
+    if combined_score < 0 or combined_score > 200000:
+        raise HTTPException(status_code=422, detail="Combined score out of range")
+
+    if not current_user:
+        return ORJSONResponse(
+            content={
+                "status": "success",
+                "message": "Login to save your math session",
+                "combined_score": combined_score,
+            }
+        )
+
+    new_id = await run_in_threadpool(
+        _store_math_session,
+        current_user["id"],
+        round1_score_id,
+        round2_score_id,
+        round3_score_id,
+        combined_score,
+    )
 
-    return JSONResponse(content={"status": "success", "session_id": new_id})
+    return ORJSONResponse(content={"status": "success", "session_id": new_id})
 
 
 @router.get("/api/math-game/round1/leaderboard")
-async def round1_leaderboard_api(current_user=Depends(get_current_user)):
+def round1_leaderboard_api(request: Request, current_user=Depends(get_current_user)):
     if not current_user:
         raise HTTPException(status_code=401, detail="Sign in required")
 
-    conn = get_db_connection()
-    try:
-        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+    body = get_cached_leaderboard("math_round1")
+    if body is not None:
+        return etag_json_response(request, body)
+
+    with db_connection(readonly=True) as conn:
+        with conn.cursor() as cursor:
             cursor.execute(
                 """
                 SELECT
@@ -327,46 +438,39 @@ async def round1_leaderboard_api(current_user=Depends(get_current_user)):
                 LIMIT 20
                 """
             )
-            rows = cursor.fetchall()
-        scores = []
-        for row in rows:
-            avg_time_raw = row.get("avg_time_ms")
-            scores.append(
-                {
-                    "username": row["username"],
-                    "score": int(row["score"]),
-                    "correct_count": int(row["correct_count"]),
-                    "wrong_count": int(row["wrong_count"]),
-                    "avg_time_ms": float(avg_time_raw)
-                    if avg_time_raw is not None
-                    else None,
-                    "created_at": row["created_at"].isoformat(),
-                }
-            )
-        return JSONResponse(content={"scores": scores})
-    finally:
-        conn.close()
+            # Column types already match the response and orjson writes the
+            # timestamps, so each row only needs its keys; zip builds the
+            # dict in C where RealDictCursor set each field from Python.
+            scores = [dict(zip(LEADERBOARD_FIELDS, row)) for row in cursor]
+        body = orjson.dumps({"scores": scores})
+        cache_leaderboard("math_round1", body)
+        return etag_json_response(request, body)
 
 
 @router.get("/api/math-game/round-mixed/leaderboard")
-async def mixed_round_leaderboard_api(
+def mixed_round_leaderboard_api(
     request: Request,
     current_user=Depends(get_current_user),
 ):
     if not current_user:
         raise HTTPException(status_code=401, detail="Sign in required")
 
-    round_index_param = request.query_params.get("round_index")
-    try:
-        round_index = int(round_index_param) if round_index_param else None
-    except ValueError:
-        round_index = None
+    # Only the real rounds get their own query and cache entry; anything else
+    # falls back to the all-rounds board, so clients cannot mint cache keys.
+    round_index = MIXED_ROUND_INDEXES.get(request.query_params.get("round_index"))
+
+    body = get_cached_leaderboard("math_round_mixed", round_index)
+    if body is not None:
+        return etag_json_response(request, body)
 
-    conn = get_db_connection()
-    try:
-        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+    # Legacy rows without a round_index count as round 2. The filter is only
+    # added when a round is requested, so each variant matches one of the
+    # partial leaderboard indexes.
+    round_filter = "AND COALESCE(s.round_index, 2) = %s" if round_index is not None else ""
+    with db_connection(readonly=True) as conn:
+        with conn.cursor() as cursor:
             cursor.execute(
-                """
+                f"""
                 SELECT
                     u.username,
                     s.score,
@@ -377,61 +481,55 @@ async def mixed_round_leaderboard_api(
                 FROM math_round_mixed_scores s
                 JOIN users u ON u.id = s.user_id
                 WHERE s.is_valid = TRUE
-                  AND (%s IS NULL OR s.round_index = %s OR (s.round_index IS NULL AND %s = 2))
+                  {round_filter}
                 ORDER BY s.score DESC, s.created_at ASC
                 LIMIT 20
                 """,
-                (round_index, round_index, round_index),
+                (round_index,) if round_index is not None else (),
             )
-            rows = cursor.fetchall()
-        scores = []
-        for row in rows:
-            avg_time_raw = row.get("avg_time_ms")
-            scores.append(
-                {
-                    "username": row["username"],
-                    "score": int(row["score"]),
-                    "correct_count": int(row["correct_count"]),
-                    "wrong_count": int(row["wrong_count"]),
-                    "avg_time_ms": float(avg_time_raw)
-                    if avg_time_raw is not None
-                    else None,
-                    "created_at": row["created_at"].isoformat(),
-                }
-            )
-        return JSONResponse(content={"scores": scores})
-    finally:
-        conn.close()
+            # Column types already match the response and orjson writes the
+            # timestamps, so each row only needs its keys; zip builds the
+            # dict in C where RealDictCursor set each field from Python.
+            scores = [dict(zip(LEADERBOARD_FIELDS, row)) for row in cursor]
+        body = orjson.dumps({"scores": scores})
+        cache_leaderboard("math_round_mixed", body, round_index)
+        return etag_json_response(request, body)
 
 
 @router.get("/api/math-game/score-distribution")
-async def math_score_distribution():
+def math_score_distribution(request: Request):
+    # Shares the round 1 leaderboard's cache entry group, so a new round 1
+    # score drops it along with the leaderboard.
+    body = get_cached_leaderboard("math_round1", "distribution")
+    if body is not None:
+        return etag_json_response(request, body)
+
     bucket_width = 20
-    conn = get_db_connection()
-    try:
+    with db_connection(readonly=True) as conn:
         with conn.cursor() as cursor:
+            # Postgres aggregates over the covering leaderboard index and
+            # returns each bucket's lower bound as an int, so Python only sees
+            # one small row per bucket and no Decimal conversions.
             cursor.execute(
                 """
-                SELECT FLOOR(score::numeric / %s) AS bucket, COUNT(*)
+                SELECT (FLOOR(score::numeric / %s) * %s)::int AS bucket_min, COUNT(*)
                 FROM math_round1_scores
                 WHERE is_valid = TRUE
-                GROUP BY bucket
-                ORDER BY bucket
+                GROUP BY bucket_min
+                ORDER BY bucket_min
                 """,
-                (bucket_width,),
+                (bucket_width, bucket_width),
             )
-            rows = cursor.fetchall()
-        buckets = []
-        for bucket, count in rows:
-            min_val = int(bucket) * bucket_width
-            max_val = min_val + bucket_width - 1
-            buckets.append({"min": min_val, "max": max_val, "count": count})
-        return JSONResponse(content={"buckets": buckets})
-    finally:
-        conn.close()
+            buckets = [
+                {"min": min_val, "max": min_val + bucket_width - 1, "count": count}
+                for min_val, count in cursor
+            ]
+        body = orjson.dumps({"buckets": buckets})
+        cache_leaderboard("math_round1", body, "distribution")
+        return etag_json_response(request, body)
 
 
 @router.get("/api/math-game/difficulty-summary")
-async def math_difficulty_summary():
+def math_difficulty_summary():
     # Placeholder; you can fill this later with real hardest/easiest logic
-    return JSONResponse(content={"hardest_questions": [], "easiest_questions": []})
+    return ORJSONResponse(content={"hardest_questions": [], "easiest_questions": []})
@@ -1,6 +1,7 @@
 
-from fastapi import APIRouter, Depends, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import ORJSONResponse
+from starlette.concurrency import run_in_threadpool
 
 from app.security import (
     get_current_user,
@@ -8,27 +9,100 @@ from app.security import (
     assert_valid_username
 )
 
-import json
-from datetime import datetime
+import orjson
 
+from app.db import db_connection, execute_prepared
 from app.achievements import check_and_award_achievements
-
-
-from app.db import get_db_connection
-from app.achievements import check_and_award_achievements
-from app.services.users import resolve_user_id
+from app.services.users import country_to_store
 from app.services.geo import get_country_code_from_ip
+from app.services.leaderboards import invalidate_leaderboard
+from app.utils.http import read_json_object
 from app.utils.validation import enforce_range
 
-from app.services.memory_game import compute_memory_scores, fetch_memory_insights
+from app.services.memory_game import (
+    compute_memory_scores,
+    fetch_memory_insights,
+)
 
 router = APIRouter()
 
+def _store_memory_score(current_user, country_code, total_score, r1, r2, r3, score_result):
+    user_id = current_user["id"]
+    new_country = country_to_store(current_user, country_code)
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            # One statement refreshes a changed country (a NULL code makes the
+            # UPDATE a no-op), inserts the score and returns the running
+            # total. A data-modifying CTE's row is not visible to the SUM in
+            # the same statement, so the new score is added on explicitly.
+            # created_at comes from the column default.
+            execute_prepared(
+                cursor,
+                "insert_memory_score",
+                """
+                WITH country_update AS (
+                    UPDATE users SET country_code = %s
+                    WHERE id = %s
+                      AND %s::text IS NOT NULL
+                      AND country_code IS DISTINCT FROM %s
+                ),
+                ins AS (
+                    INSERT INTO memory_scores (
+                        user_id, total_score, round1_score, round2_score, round3_score, raw_payload
+                    ) VALUES (%s, %s, %s, %s, %s, %s)
+                    RETURNING id, created_at, total_score
+                )
+                SELECT
+                    ins.id,
+                    ins.created_at,
+                    ins.total_score + (
+                        SELECT COALESCE(SUM(total_score), 0)
+                        FROM memory_scores
+                        WHERE user_id = %s
+                    )
+                FROM ins
+                """,
+                (
+                    new_country,
+                    user_id,
+                    new_country,
+                    new_country,
+                    user_id,
+                    total_score,
+                    r1,
+                    r2,
+                    r3,
+                    orjson.dumps(
+                        {
+                            "near_misses": score_result["near_misses"],
+                            "guess_count": score_result["guess_count"],
+                            "avg_duration_ms": score_result["avg_duration_ms"],
+                            "avg_interval_ms": score_result["avg_interval_ms"],
+                        }
+                    ).decode(),
+                    user_id,
+                ),
+            )
+            inserted = cursor.fetchone()
+            running_total = inserted[2] or 0
+        check_and_award_achievements(
+            conn,
+            user_id,
+            "memory",
+            {
+                "total_score": total_score,
+                "running_total": running_total,
+                "created_at": inserted[1],
+            },
+        )
+        conn.commit()
+
+
 @router.post("/memory-game/submit_score")
 async def submit_memory_score(
     request: Request, current_user=Depends(get_current_user), _=Depends(csrf_protected)
 ):
-    data = await request.json()
+    data = await read_json_object(request)
     username = data.get("username")
     country_input = data.get("country") or data.get("countryCode")
     question_log = data.get("questionLog") or []
@@ -36,37 +110,11 @@ async def submit_memory_score(
     if not current_user and username:
         assert_valid_username(username)
 
-    if not isinstance(question_log, list) or not (1 <= len(question_log) <= 200):
-        raise HTTPException(status_code=422, detail="Invalid question log length")
-
-    for entry in question_log:
-        if not isinstance(entry, dict):
-            raise HTTPException(status_code=422, detail="Question entries must be objects")
-        round_num = entry.get("round")
-        seq_len = entry.get("sequenceLength")
-        attempts = entry.get("attempts")
-        was_correct = entry.get("wasCorrect")
-        targets = entry.get("targets") or entry.get("targetCells") or []
-        clicks = entry.get("clicks") or []
-        if round_num not in (1, 2, 3):
-            raise HTTPException(status_code=422, detail="Round must be between 1 and 3")
-        if seq_len is None or not (1 <= seq_len <= 25):
-            raise HTTPException(status_code=422, detail="Sequence length out of bounds")
-        if attempts is None or attempts < 1:
-            raise HTTPException(status_code=422, detail="Attempts must be at least 1")
-        if was_correct not in (True, False):
-            raise HTTPException(status_code=422, detail="Each question must include correctness")
-        if targets and not all(isinstance(t, (list, tuple)) and len(t) >= 2 for t in targets):
-            raise HTTPException(status_code=422, detail="Targets must be coordinates")
-        if clicks and not all(isinstance(c, dict) for c in clicks):
-            raise HTTPException(status_code=422, detail="Clicks must be objects")
-
     score_result = compute_memory_scores(question_log)
     total_score = max(0, score_result["total"])
     r1 = max(0, score_result["round1"])
     r2 = max(0, score_result["round2"])
     r3 = max(0, score_result["round3"])
-    country_code = country_input or get_country_code_from_ip(request.client.host)
 
     enforce_range(total_score, 0, 200000, "Total score")
     enforce_range(r1, 0, 80000, "Round 1 score")
@@ -87,55 +135,14 @@ async def submit_memory_score(
 
     if not current_user:
         response_payload["message"] = "Login to save your memory score"
-        return JSONResponse(content=response_payload)
+        return ORJSONResponse(content=response_payload)
 
-    conn = get_db_connection()
-    try:
-        user_id = resolve_user_id(conn, current_user, username, country_code)
-        created_at = datetime.utcnow().isoformat()
-        with conn.cursor() as cursor:
-            cursor.execute(
-                """
-                INSERT INTO memory_scores (
-                    user_id, total_score, round1_score, round2_score, round3_score, raw_payload, created_at
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s)
-                RETURNING id, created_at
-                """,
-                (
-                    user_id,
-                    total_score,
-                    r1,
-                    r2,
-                    r3,
-                    json.dumps(
-                        {
-                            "near_misses": score_result["near_misses"],
-                            "guess_count": score_result["guess_count"],
-                            "avg_duration_ms": score_result["avg_duration_ms"],
-                            "avg_interval_ms": score_result["avg_interval_ms"],
-                        }
-                    ),
-                    created_at,
-                ),
-            )
-            inserted = cursor.fetchone()
-            cursor.execute(
-                "SELECT COALESCE(SUM(total_score), 0) FROM memory_scores WHERE user_id = %s",
-                (user_id,),
-            )
-            running_total = cursor.fetchone()[0] or 0
-        check_and_award_achievements(
-            conn,
-            user_id,
-            "memory",
-            {
-                "total_score": total_score,
-                "running_total": running_total,
-                "created_at": inserted[1] if inserted else created_at,
-            },
-        )
-        conn.commit()
-    finally:
-        conn.close()
+    # Only saved scores record a country, so anonymous players never wait
+    # on the IP lookup.
+    country_code = country_input or await get_country_code_from_ip(request.client.host)
+    await run_in_threadpool(
+        _store_memory_score, current_user, country_code, total_score, r1, r2, r3, score_result
+    )
+    invalidate_leaderboard("memory")
 
-    return JSONResponse(content=response_payload)
+    return ORJSONResponse(content=response_payload)
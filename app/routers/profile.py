@@ -5,11 +5,11 @@ from typing import Any
 import psycopg2.extras
 from fastapi import APIRouter, Depends, Form, HTTPException, Request, status
 from fastapi.encoders import jsonable_encoder
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse, RedirectResponse
 
 from app.achievements import get_all_achievements, get_user_achievements
 from app.analytics import get_profile_metrics
-from app.db import get_db_connection
+from app.db import db_connection
 from app.dependencies import templates
 from app.security import get_current_user, render_template
 from app.services.users import normalize_profile_fields
@@ -31,12 +31,11 @@ def _get_user_by_username(conn, username: str):
 
 
 @router.get("/profile", response_class=HTMLResponse)
-async def profile_page(request: Request, current_user=Depends(get_current_user)):
+def profile_page(request: Request, current_user=Depends(get_current_user)):
     if not current_user:
         return RedirectResponse("/", status_code=status.HTTP_302_FOUND)
 
-    conn = get_db_connection()
-    try:
+    with db_connection(readonly=True) as conn:
         with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
             cursor.execute(
                 """
@@ -49,8 +48,6 @@ async def profile_page(request: Request, current_user=Depends(get_current_user))
         metrics = get_profile_metrics(conn, current_user["id"])
         user_achievements = get_user_achievements(conn, current_user["id"])
         all_achievements = get_all_achievements(conn)
-    finally:
-        conn.close()
 
     return render_template(
         templates,
@@ -68,7 +65,7 @@ async def profile_page(request: Request, current_user=Depends(get_current_user))
 
 
 @router.post("/profile", response_class=HTMLResponse)
-async def update_profile(
+def update_profile(
     request: Request,
     current_user=Depends(get_current_user),
     country_code: str = Form(None),
@@ -87,8 +84,7 @@ async def update_profile(
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
 
-    conn = get_db_connection()
-    try:
+    with db_connection() as conn:
         with conn.cursor() as cursor:
             cursor.execute(
                 """
@@ -106,16 +102,13 @@ async def update_profile(
                 ),
             )
         conn.commit()
-    finally:
-        conn.close()
 
     return RedirectResponse("/profile", status_code=status.HTTP_303_SEE_OTHER)
 
 
 @router.get("/profile/{username}", response_class=HTMLResponse)
-async def public_profile(request: Request, username: str, current_user=Depends(get_current_user)):
-    conn = get_db_connection()
-    try:
+def public_profile(request: Request, username: str, current_user=Depends(get_current_user)):
+    with db_connection(readonly=True) as conn:
         profile_user = _get_user_by_username(conn, username)
         if not profile_user:
             raise HTTPException(status_code=404, detail="User not found")
@@ -125,8 +118,6 @@ async def public_profile(request: Request, username: str, current_user=Depends(g
         metrics = get_profile_metrics(conn, profile_user["id"])
         user_achievements = get_user_achievements(conn, profile_user["id"])
         all_achievements = get_all_achievements(conn)
-    finally:
-        conn.close()
 
     return render_template(
         templates,
@@ -143,10 +134,9 @@ async def public_profile(request: Request, username: str, current_user=Depends(g
     )
 
 
-@router.get("/api/profile/{username}/metrics", response_class=JSONResponse)
-async def profile_metrics_api(username: str, current_user=Depends(get_current_user)):
-    conn = get_db_connection()
-    try:
+@router.get("/api/profile/{username}/metrics", response_class=ORJSONResponse)
+def profile_metrics_api(username: str, current_user=Depends(get_current_user)):
+    with db_connection(readonly=True) as conn:
         profile_user = _get_user_by_username(conn, username)
         if not profile_user:
             raise HTTPException(status_code=404, detail="User not found")
@@ -158,10 +148,8 @@ async def profile_metrics_api(username: str, current_user=Depends(get_current_us
         all_achievements = get_all_achievements(conn)
         earned_codes = {a["code"] for a in earned}
         locked = [a for a in all_achievements if a["code"] not in earned_codes]
-    finally:
-        conn.close()
 
-    return JSONResponse(
+    return ORJSONResponse(
         content=jsonable_encoder(
             {
                 "metrics": metrics,
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
-from fastapi.responses import JSONResponse
-from datetime import datetime
+from fastapi.responses import ORJSONResponse
+from starlette.concurrency import run_in_threadpool
 
 from app.security import (
     get_current_user,
@@ -9,10 +9,12 @@ from app.security import (
     render_template,   # if needed
 )
 
-from app.db import get_db_connection
+from app.db import db_connection, execute_prepared
 from app.achievements import check_and_award_achievements
-from app.services.users import resolve_user_id
+from app.services.users import country_to_store
 from app.services.geo import get_country_code_from_ip
+from app.services.leaderboards import invalidate_leaderboard
+from app.utils.http import read_json_object
 from app.utils.validation import enforce_range
 
 # GAME-SPECIFIC imports
@@ -25,11 +27,69 @@ from app.services.reaction_game import (
 
 router = APIRouter()
 
+def _store_reaction_score(
+    current_user,
+    country_code,
+    final_score,
+    average_time_ms,
+    fastest_time_ms,
+    slowest_time_ms,
+    accuracy,
+):
+    user_id = current_user["id"]
+    new_country = country_to_store(current_user, country_code)
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            # The country refresh rides along with the insert; a NULL code
+            # makes the UPDATE a no-op. created_at comes from the column default.
+            execute_prepared(
+                cursor,
+                "insert_reaction_score",
+                """
+                WITH country_update AS (
+                    UPDATE users SET country_code = %s
+                    WHERE id = %s
+                      AND %s::text IS NOT NULL
+                      AND country_code IS DISTINCT FROM %s
+                )
+                INSERT INTO reaction_scores (
+                    user_id, score, average_time_ms, fastest_time_ms,
+                    slowest_time_ms, accuracy
+                ) VALUES (%s, %s, %s, %s, %s, %s)
+                RETURNING id, created_at
+                """,
+                (
+                    new_country,
+                    user_id,
+                    new_country,
+                    new_country,
+                    user_id,
+                    final_score,
+                    average_time_ms,
+                    fastest_time_ms,
+                    slowest_time_ms,
+                    accuracy,
+                ),
+            )
+            inserted = cursor.fetchone()
+        check_and_award_achievements(
+            conn,
+            user_id,
+            "reaction",
+            {
+                "average_time_ms": average_time_ms,
+                "accuracy": accuracy,
+                "created_at": inserted[1],
+            },
+        )
+        conn.commit()
+
+
 @router.post("/reaction-game/submit_score")
 async def submit_reaction_score(
     request: Request, current_user=Depends(get_current_user), _=Depends(csrf_protected)
 ):
-    data = await request.json()
+    data = await read_json_object(request)
     username = data.get("username")
     country_input = data.get("country") or data.get("countryCode")
     score_data = data.get("scoreData") or {}
@@ -40,7 +100,6 @@ async def submit_reaction_score(
     validate_answer_record(answer_record)
 
     score_result = calculate_reaction_game_score(answer_record)
-    country_code = country_input or get_country_code_from_ip(request.client.host)
     final_score = score_result["finalScore"]
     average_time_ms = score_result["averageTime"]
     fastest_time_ms = score_result["fastestTime"]
@@ -54,7 +113,7 @@ async def submit_reaction_score(
     enforce_range(accuracy, 0, 100, "Accuracy")
 
     if not current_user:
-        return JSONResponse(
+        return ORJSONResponse(
             content={
                 "status": "success",
                 "scoreResult": score_result,
@@ -62,44 +121,20 @@ async def submit_reaction_score(
             }
         )
 
-    conn = get_db_connection()
-    try:
-        user_id = resolve_user_id(conn, current_user, username, country_code)
-        created_at = datetime.utcnow().isoformat()
-        with conn.cursor() as cursor:
-            cursor.execute(
-                """
-                INSERT INTO reaction_scores (
-                    user_id, score, average_time_ms, fastest_time_ms,
-                    slowest_time_ms, accuracy, created_at
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s)
-                RETURNING id, created_at
-                """,
-                (
-                    user_id,
-                    final_score,
-                    average_time_ms,
-                    fastest_time_ms,
-                    slowest_time_ms,
-                    accuracy,
-                    created_at,
-                ),
-            )
-            inserted = cursor.fetchone()
-        check_and_award_achievements(
-            conn,
-            user_id,
-            "reaction",
-            {
-                "average_time_ms": average_time_ms,
-                "accuracy": accuracy,
-                "created_at": inserted[1] if inserted else created_at,
-            },
-        )
-        conn.commit()
-    finally:
-        conn.close()
-
+    # Only saved scores record a country, so anonymous players never wait
+    # on the IP lookup.
+    country_code = country_input or await get_country_code_from_ip(request.client.host)
+    await run_in_threadpool(
+        _store_reaction_score,
+        current_user,
+        country_code,
+        final_score,
+        average_time_ms,
+        fastest_time_ms,
+        slowest_time_ms,
+        accuracy,
+    )
+    invalidate_leaderboard("reaction")
 
-    return JSONResponse(content={"status": "success", "scoreResult": score_result})
+    return ORJSONResponse(content={"status": "success", "scoreResult": score_result})
 
@@ -0,0 +1,22 @@
+import math
+from typing import Annotated
+
+from pydantic import BaseModel, BeforeValidator
+
+
+def _truncate_float(value):
+    # The JS client can send a float (12.0, or 12.5 from a mean); the handler
+    # used to int() these, so keep truncating instead of answering 422.
+    if isinstance(value, float) and math.isfinite(value):
+        return int(value)
+    return value
+
+
+LenientInt = Annotated[int | None, BeforeValidator(_truncate_float)]
+
+
+class MathSessionIn(BaseModel):
+    round1_score_id: LenientInt = None
+    round2_score_id: LenientInt = None
+    round3_score_id: LenientInt = None
+    combined_score: LenientInt = None
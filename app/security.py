@@ -1,4 +1,6 @@
-import re
+import base64
+import hashlib
+import hmac
 import secrets
 from typing import Optional
 
@@ -8,16 +10,41 @@ from fastapi import HTTPException, Request
 from fastapi.templating import Jinja2Templates
 from passlib.context import CryptContext
 
-from .config import SESSION_COOKIE_NAME, SESSION_COOKIE_SECURE, SESSION_MAX_AGE_LONG, SESSION_MAX_AGE_SHORT
-from .db import get_db_connection
-
-USERNAME_RE = re.compile(r"^[A-Za-z0-9_]{3,20}$")
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-csrf_sessions: dict[str, str] = {}
+from .config import (
+    SESSION_COOKIE_NAME,
+    SESSION_SECRET,
+    SESSION_COOKIE_SECURE,
+    SESSION_MAX_AGE_LONG,
+    SESSION_MAX_AGE_SHORT,
+)
+from .db import db_connection, execute_prepared
+from .utils.http import apply_etag
+
+SESSION_ID_BYTES = 16
+USERNAME_MIN_LENGTH = 3
+USERNAME_MAX_LENGTH = 20
+# argon2id for new hashes (OWASP parameters); bcrypt stays so existing hashes
+# still verify, and they are upgraded on the user's next login.
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    deprecated="auto",
+    argon2__memory_cost=19456,
+    argon2__time_cost=2,
+    argon2__parallelism=1,
+)
+# CSRF tokens are derived from the session id rather than stored, so any
+# worker can verify them and nothing accumulates in memory.
+_csrf_key = SESSION_SECRET.encode("utf-8") if SESSION_SECRET else secrets.token_bytes(32)
 
 
 def assert_valid_username(username: str):
-    if not USERNAME_RE.match(username or ""):
+    # Equivalent to ^[A-Za-z0-9_]{3,20}$ without going through the regex engine.
+    if (
+        not username
+        or not (USERNAME_MIN_LENGTH <= len(username) <= USERNAME_MAX_LENGTH)
+        or not username.isascii()
+        or not username.replace("_", "a").isalnum()
+    ):
         raise HTTPException(status_code=400, detail="Invalid username")
 
 
@@ -27,34 +54,64 @@ def hash_password(password: str) -> str:
 
 def verify_password(password: str, password_hash: str | None) -> bool:
     if not password_hash:
+        # Spend as long as a real check, so response time does not reveal
+        # whether the account exists or has a password.
+        pwd_context.dummy_verify()
         return False
     return pwd_context.verify(password, password_hash)
 
 
-def ensure_session_tokens(request: Request):
-    session_id = request.cookies.get("session_id")
-    csrf_token = csrf_sessions.get(session_id)
-    new_cookie = False
+def verify_and_update_password(password: str, password_hash: str | None) -> tuple[bool, str | None]:
+    """Verify a password; also return a replacement hash if the stored one is outdated."""
+    if not password_hash:
+        pwd_context.dummy_verify()
+        return False, None
+    return pwd_context.verify_and_update(password, password_hash)
+
 
-    if not session_id:
-        session_id = secrets.token_urlsafe(16)
-        new_cookie = True
+def _urlsafe_token(raw: bytes) -> str:
+    # Same encoding as secrets.token_urlsafe, for bytes we already drew.
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
 
-    if csrf_token is None:
-        csrf_token = secrets.token_urlsafe(32)
-        csrf_sessions[session_id] = csrf_token
 
-    return session_id, csrf_token, new_cookie
+def csrf_token_for(session_id: str) -> str:
+    digest = hmac.new(_csrf_key, session_id.encode("utf-8"), hashlib.sha256).digest()
+    return _urlsafe_token(digest)
+
+
+def ensure_session_tokens(request: Request):
+    session_id = request.cookies.get("session_id")
+    new_cookie = not session_id
+    if new_cookie:
+        session_id = _urlsafe_token(secrets.token_bytes(SESSION_ID_BYTES))
+    return session_id, csrf_token_for(session_id), new_cookie
 
 
 def csrf_protected(request: Request):
     session_id = request.cookies.get("session_id")
     csrf_header = request.headers.get("X-CSRF-Token")
-    expected = csrf_sessions.get(session_id)
-    if not session_id or expected is None or expected != csrf_header:
+    if (
+        not session_id
+        or not csrf_header
+        # Bytes, because compare_digest raises TypeError on non-ASCII str.
+        or not hmac.compare_digest(
+            csrf_token_for(session_id).encode("ascii"), csrf_header.encode("utf-8")
+        )
+    ):
         raise HTTPException(status_code=403, detail="Invalid CSRF token")
 
 
+def set_session_id_cookie(response, session_id: str):
+    # Anonymous session id that the CSRF token is derived from.
+    response.set_cookie(
+        "session_id",
+        session_id,
+        httponly=True,
+        samesite="lax",
+        secure=SESSION_COOKIE_SECURE,
+    )
+
+
 def set_session_cookie(response, user_id: int, remember: bool):
     max_age = SESSION_MAX_AGE_LONG if remember else SESSION_MAX_AGE_SHORT
     response.set_cookie(
@@ -77,10 +134,12 @@ def clear_session_cookie(response):
 
 
 def get_user_by_id(user_id: int) -> Optional[dict]:
-    conn = get_db_connection()
-    try:
+    with db_connection(readonly=True) as conn:
         with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
-            cursor.execute(
+            # Runs on every authenticated request, so keep it prepared.
+            execute_prepared(
+                cursor,
+                "get_user_by_id",
                 """
                 SELECT
                     id,
@@ -98,8 +157,6 @@ def get_user_by_id(user_id: int) -> Optional[dict]:
             )
             row = cursor.fetchone()
             return dict(row) if row else None
-    finally:
-        conn.close()
 
 
 def get_current_user_from_request(request: Request) -> Optional[dict]:
@@ -115,7 +172,9 @@ def get_current_user_from_request(request: Request) -> Optional[dict]:
     return get_user_by_id(user_id)
 
 
-async def get_current_user(request: Request) -> Optional[dict]:
+def get_current_user(request: Request) -> Optional[dict]:
+    # Sync on purpose: the user lookup blocks on psycopg2, so FastAPI runs this
+    # dependency in the threadpool rather than on the event loop.
     return get_current_user_from_request(request)
 
 
@@ -130,5 +189,5 @@ def render_template(templates: Jinja2Templates, file_name: str, request: Request
 
     response = templates.TemplateResponse(file_name, base_context)
     if new_cookie:
-        response.set_cookie("session_id", session_id, httponly=True, samesite="lax")
-    return response
+        set_session_id_cookie(response, session_id)
+    return apply_etag(request, response)
@@ -1,6 +1,65 @@
-import requests
+import logging
 
-def get_country_code_from_ip(client_ip: str | None) -> str:
+import httpx
+from cachetools import TTLCache
+
+from app.config import GEOIP_DB_PATH
+
+try:
+    import maxminddb
+except ImportError:  # optional; falls back to the HTTP lookup
+    maxminddb = None
+
+logger = logging.getLogger(__name__)
+
+# IP -> country code; the same visitors submit many rounds per day.
+_country_cache: TTLCache = TTLCache(maxsize=10_000, ttl=60 * 60 * 24)
+# Both are opened on first use and reset by close_geo_client, so a later
+# startup in the same process (TestClient, reload) gets fresh ones.
+_client: httpx.AsyncClient | None = None
+_geo_reader = None
+# Set when GEOIP_DB_PATH cannot be opened, so the failure is logged once and
+# lookups fall back to HTTP instead of retrying the open on every request.
+_geo_reader_failed = False
+
+
+def _get_client() -> httpx.AsyncClient:
+    # Shared client so lookups reuse pooled keep-alive connections; bounded so
+    # a burst of new visitors cannot open an unbounded number of sockets.
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=1.5,
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=8),
+        )
+    return _client
+
+
+def _get_geo_reader():
+    # Local GeoLite2-Country database, memory-mapped; lookups take
+    # microseconds and never leave the process.
+    global _geo_reader, _geo_reader_failed
+    if _geo_reader is None and not _geo_reader_failed and maxminddb is not None and GEOIP_DB_PATH:
+        try:
+            _geo_reader = maxminddb.open_database(GEOIP_DB_PATH, mode=maxminddb.MODE_MMAP)
+        except (OSError, ValueError, maxminddb.InvalidDatabaseError):
+            _geo_reader_failed = True
+            logger.exception("Cannot open GEOIP_DB_PATH %s; using the HTTP lookup", GEOIP_DB_PATH)
+    return _geo_reader
+
+
+def _lookup_local(geo_reader, client_ip: str) -> str | None:
+    try:
+        record = geo_reader.get(client_ip)
+    except ValueError:  # not a valid IP address
+        return None
+    if not record:
+        return None
+    country = record.get("country") or record.get("registered_country") or {}
+    return country.get("iso_code")
+
+
+async def get_country_code_from_ip(client_ip: str | None) -> str:
     """
     Map IP -> ISO country code (e.g. 'IE', 'GB').
     We do NOT store the IP anywhere, just use it transiently.
@@ -8,16 +67,38 @@ def get_country_code_from_ip(client_ip: str | None) -> str:
     if not client_ip:
         return "??"
 
+    cached = _country_cache.get(client_ip)
+    if cached is not None:
+        return cached
+
+    geo_reader = _get_geo_reader()
+    if geo_reader is not None:
+        code = _lookup_local(geo_reader, client_ip) or "??"
+        _country_cache[client_ip] = code
+        return code
+
     try:
         # Example using ipapi.co – swap if you prefer another service
-        resp = requests.get(f"https://ipapi.co/{client_ip}/json/", timeout=1.5)
+        resp = await _get_client().get(f"https://ipapi.co/{client_ip}/json/")
         if resp.status_code != 200:
             return "??"
         data = resp.json()
         code = data.get("country")  # 'IE', 'GB', 'ES', ...
         if code and len(code) == 2:
+            _country_cache[client_ip] = code
             return code
     except Exception:
         pass
 
-    return "??"
\ No newline at end of file
+    return "??"
+
+
+async def close_geo_client() -> None:
+    global _client, _geo_reader, _geo_reader_failed
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    if _geo_reader is not None:
+        _geo_reader.close()
+        _geo_reader = None
+    _geo_reader_failed = False
@@ -0,0 +1,36 @@
+import threading
+import time
+from typing import Hashable, Optional
+
+# Leaderboards only change when a score is submitted, so bursts of visitors
+# can share one query. Entries hold the already-encoded JSON body and are
+# dropped as soon as a new score for that game is saved.
+LEADERBOARD_CACHE_TTL_SECONDS = 2.0
+
+_cache: dict[tuple[str, Hashable], tuple[float, bytes]] = {}
+_cache_lock = threading.Lock()
+
+
+def get_cached_leaderboard(game: str, variant: Hashable = None) -> Optional[bytes]:
+    key = (game, variant)
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is None:
+            return None
+        stored_at, body = entry
+        if time.monotonic() - stored_at >= LEADERBOARD_CACHE_TTL_SECONDS:
+            # Drop it now rather than waiting for the next invalidation.
+            del _cache[key]
+            return None
+    return body
+
+
+def cache_leaderboard(game: str, body: bytes, variant: Hashable = None) -> None:
+    with _cache_lock:
+        _cache[(game, variant)] = (time.monotonic(), body)
+
+
+def invalidate_leaderboard(game: str) -> None:
+    with _cache_lock:
+        for key in [key for key in _cache if key[0] == game]:
+            del _cache[key]
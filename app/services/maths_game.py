@@ -1,5 +1,4 @@
 from typing import Dict, List, Optional
-import psycopg2.extras
 
 def summarize_math_times(rows: list, question_key: str) -> tuple[dict, float]:
     type_totals: dict[str, float] = {}
@@ -32,30 +31,36 @@ def summarize_math_times(rows: list, question_key: str) -> tuple[dict, float]:
 
 
 def fetch_math_insights(conn, user_id: int) -> dict:
-    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+    # One round trip: recent payloads come back as JSON arrays of
+    # {"raw_payload": ...} objects, next to both per-user bests.
+    with conn.cursor() as cursor:
         cursor.execute(
-            "SELECT raw_payload, score FROM math_round1_scores WHERE user_id = %s ORDER BY created_at DESC LIMIT 50",
-            (user_id,),
+            """
+            SELECT
+                (
+                    SELECT COALESCE(json_agg(r1), '[]'::json)
+                    FROM (
+                        SELECT raw_payload FROM math_round1_scores
+                        WHERE user_id = %(user_id)s
+                        ORDER BY created_at DESC
+                        LIMIT 50
+                    ) AS r1
+                ) AS round1_rows,
+                (
+                    SELECT COALESCE(json_agg(r2), '[]'::json)
+                    FROM (
+                        SELECT raw_payload FROM math_round_mixed_scores
+                        WHERE user_id = %(user_id)s
+                        ORDER BY created_at DESC
+                        LIMIT 50
+                    ) AS r2
+                ) AS round2_rows,
+                (SELECT MAX(score) FROM math_round1_scores WHERE user_id = %(user_id)s) AS best_r1,
+                (SELECT MAX(score) FROM math_round_mixed_scores WHERE user_id = %(user_id)s) AS best_r2
+            """,
+            {"user_id": user_id},
         )
-        round1_rows = cursor.fetchall()
-
-        cursor.execute(
-            "SELECT raw_payload, score FROM math_round_mixed_scores WHERE user_id = %s ORDER BY created_at DESC LIMIT 50",
-            (user_id,),
-        )
-        round2_rows = cursor.fetchall()
-
-        cursor.execute(
-            "SELECT MAX(score) FROM math_round1_scores WHERE user_id = %s",
-            (user_id,),
-        )
-        best_r1 = cursor.fetchone()[0]
-
-        cursor.execute(
-            "SELECT MAX(score) FROM math_round_mixed_scores WHERE user_id = %s",
-            (user_id,),
-        )
-        best_r2 = cursor.fetchone()[0]
+        round1_rows, round2_rows, best_r1, best_r2 = cursor.fetchone()
 
     r1_avgs, r1_overall = summarize_math_times(round1_rows, "per_question_times")
     r2_avgs, r2_overall = summarize_math_times(round2_rows, "per_question")
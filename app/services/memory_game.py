@@ -1,38 +1,91 @@
 
 #FIXME
 
+import math
 from typing import Dict, List
 
+from fastapi import HTTPException
+
+# A question shows at most 25 cells and ends at the first wrong click, so
+# anything far beyond these is not a real game log.
+MAX_TARGETS_PER_QUESTION = 25
+MAX_CLICKS_PER_QUESTION = 100
+
+def _is_finite_number(value) -> bool:
+    # Python ints are always finite; floats may be inf or nan.
+    return isinstance(value, int) or (isinstance(value, float) and math.isfinite(value))
+
+
+def _validated_entry(entry) -> tuple:
+    """Check one question log entry and return the fields scoring uses."""
+    if not isinstance(entry, dict):
+        raise HTTPException(status_code=422, detail="Question entries must be objects")
+    round_num = entry.get("round")
+    seq_len = entry.get("sequenceLength")
+    attempts = entry.get("attempts")
+    was_correct = entry.get("wasCorrect")
+    targets = entry.get("targets") or entry.get("targetCells") or []
+    clicks = entry.get("clicks") or []
+    if round_num not in (1, 2, 3):
+        raise HTTPException(status_code=422, detail="Round must be between 1 and 3")
+    # The isinstance checks also turn non-numeric values into a 422 rather
+    # than a TypeError from the comparison.
+    if not _is_finite_number(seq_len) or not (1 <= seq_len <= 25):
+        raise HTTPException(status_code=422, detail="Sequence length out of bounds")
+    if not _is_finite_number(attempts) or attempts < 1:
+        raise HTTPException(status_code=422, detail="Attempts must be at least 1")
+    if was_correct not in (True, False):
+        raise HTTPException(status_code=422, detail="Each question must include correctness")
+    # Bounding the lists also bounds the scoring work per submission.
+    if (
+        not isinstance(targets, (list, tuple))
+        or len(targets) > MAX_TARGETS_PER_QUESTION
+        or not all(
+            isinstance(t, (list, tuple))
+            and len(t) == 2
+            and _is_finite_number(t[0])
+            and _is_finite_number(t[1])
+            for t in targets
+        )
+    ):
+        raise HTTPException(status_code=422, detail="Targets must be coordinates")
+    if (
+        not isinstance(clicks, list)
+        or len(clicks) > MAX_CLICKS_PER_QUESTION
+        or not all(isinstance(c, dict) for c in clicks)
+    ):
+        raise HTTPException(status_code=422, detail="Clicks must be objects")
+    return int(round_num), bool(was_correct), int(attempts), targets, clicks
+
+
 def compute_memory_scores(question_log: List[Dict]) -> dict:
-    """Compute per-round scores, partial credit, and timing insights.
+    """Validate the question log and compute per-round scores, partial credit,
+    and timing insights in a single pass.
 
     Scoring rule:
     +2 for correct on first attempt, +1 for correct with retries, -1 for incorrect.
     Partial credit is awarded for near misses (within 1-2 grid cells) based on the
     closest incorrect click. Timing metrics capture within-question pacing.
+
+    Raises a 422 HTTPException for a malformed log.
     """
+    if not isinstance(question_log, list) or not (1 <= len(question_log) <= 200):
+        raise HTTPException(status_code=422, detail="Invalid question log length")
 
     round_scores = {1: 0.0, 2: 0.0, 3: 0.0}
     near_miss_count = 0
     total_clicks = 0
     durations = []
-    intervals = []
+    interval_total = 0.0
+    interval_count = 0
 
     for entry in question_log:
-        round_num = int(entry.get("round", 0))
-        if round_num not in round_scores:
-            continue
+        # Validation already read every field scoring needs.
+        round_num, was_correct, attempts, targets, clicks = _validated_entry(entry)
 
-        was_correct = bool(entry.get("wasCorrect", False))
-        attempts = max(int(entry.get("attempts", 1) or 1), 1)
-        targets = entry.get("targets") or entry.get("targetCells") or []
-        clicks = entry.get("clicks") or []
-
-        if not isinstance(targets, (list, tuple)):
-            targets = []
-        targets_list = list(targets)
-
-        correct_cells = {(int(x), int(y)) for x, y in targets_list if isinstance(targets_list, list)}
+        correct_cells = {(int(x), int(y)) for x, y in targets}
+        # Iterating a tuple is cheaper than iterating the set on every click.
+        target_cells = tuple(correct_cells)
         best_distance = None
         click_times = []
 
@@ -40,13 +93,17 @@ def compute_memory_scores(question_log: List[Dict]) -> dict:
             try:
                 cx = int(click.get("x"))
                 cy = int(click.get("y"))
-            except (TypeError, ValueError):
+            except (TypeError, ValueError, OverflowError):
                 continue
             total_clicks += 1
 
             if correct_cells:
-                distances = [abs(cx - tx) + abs(cy - ty) for tx, ty in correct_cells]
-                min_dist = min(distances)
+                # Hits are the common case; the set answers them without
+                # measuring the distance to every target.
+                if (cx, cy) in correct_cells:
+                    min_dist = 0
+                else:
+                    min_dist = min(abs(cx - tx) + abs(cy - ty) for tx, ty in target_cells)
                 best_distance = min(best_distance, min_dist) if best_distance is not None else min_dist
                 if min_dist == 1:
                     near_miss_count += 1
@@ -71,9 +128,12 @@ def compute_memory_scores(question_log: List[Dict]) -> dict:
         round_scores[round_num] += base_score + partial_credit
 
         if click_times:
-            click_times.sort()
-            durations.append(click_times[-1] - click_times[0])
-            intervals.extend([b - a for a, b in zip(click_times, click_times[1:])])
+            # Consecutive gaps between sorted times telescope to max - min,
+            # so neither a sort nor a per-gap list is needed.
+            duration = max(click_times) - min(click_times)
+            durations.append(duration)
+            interval_total += duration
+            interval_count += len(click_times) - 1
 
     r1 = round_scores[1]
     r2 = round_scores[2]
@@ -81,7 +141,7 @@ def compute_memory_scores(question_log: List[Dict]) -> dict:
     total = r1 + r2 + r3
 
     avg_duration_ms = sum(durations) / len(durations) if durations else 0.0
-    avg_interval_ms = sum(intervals) / len(intervals) if intervals else 0.0
+    avg_interval_ms = interval_total / interval_count if interval_count else 0.0
 
     return {
         "total": total,
@@ -96,20 +156,30 @@ def compute_memory_scores(question_log: List[Dict]) -> dict:
 
 
 def fetch_memory_insights(conn, user_id: int) -> dict:
-    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+    with conn.cursor() as cursor:
         cursor.execute(
             """
-            SELECT total_score, round1_score, round2_score, round3_score
-            FROM memory_scores
-            WHERE user_id = %s
-            ORDER BY created_at DESC
-            LIMIT 25
+            WITH recent AS (
+                SELECT total_score, round1_score, round2_score, round3_score
+                FROM memory_scores
+                WHERE user_id = %s
+                ORDER BY created_at DESC
+                LIMIT 25
+            )
+            SELECT
+                COUNT(*) AS games,
+                MAX(total_score)::float8 AS best_total,
+                AVG(total_score)::float8 AS avg_total,
+                AVG(COALESCE(round1_score, 0))::float8 AS r1_avg,
+                AVG(COALESCE(round2_score, 0))::float8 AS r2_avg,
+                AVG(COALESCE(round3_score, 0))::float8 AS r3_avg
+            FROM recent
             """,
             (user_id,),
         )
-        rows = cursor.fetchall()
+        games, best_total, avg_total, r1_avg, r2_avg, r3_avg = cursor.fetchone()
 
-    if not rows:
+    if not games:
         return {
             "best_total": None,
             "average_total": None,
@@ -119,14 +189,11 @@ def fetch_memory_insights(conn, user_id: int) -> dict:
             "weaknesses": [],
         }
 
-    totals = [r["total_score"] for r in rows]
-    best_total = max(totals)
-    avg_total = sum(totals) / len(totals)
-
-    r1_avg = sum((r["round1_score"] or 0) for r in rows) / len(rows)
-    r2_avg = sum((r["round2_score"] or 0) for r in rows) / len(rows)
-    r3_avg = sum((r["round3_score"] or 0) for r in rows) / len(rows)
-    round_avgs = {1: round(r1_avg, 2), 2: round(r2_avg, 2), 3: round(r3_avg, 2)}
+    round_avgs = {
+        1: round(r1_avg, 2),
+        2: round(r2_avg, 2),
+        3: round(r3_avg, 2),
+    }
 
     normalized_total = min(100.0, max(0.0, (avg_total / 30.0) * 100.0))
     peak_bonus = min(10.0, best_total)
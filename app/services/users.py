@@ -1,13 +1,5 @@
 from typing import Optional
 
-import psycopg2
-import psycopg2.extras
-
-from typing import Optional
-
-from app.security import assert_valid_username
-from app.db import get_db_connection
-
 ALLOWED_SEX = {"male", "female", "other", "prefer_not_to_say"}
 ALLOWED_AGE_BANDS = {
     "18-20",
@@ -50,55 +42,17 @@ def normalize_profile_fields(
     )
 
 
-def get_or_create_user(conn, username: str, country_code: str | None) -> int:
-    assert_valid_username(username)
-    with conn.cursor() as cursor:
-        cursor.execute(
-            "SELECT id, country_code FROM users WHERE username = %s",
-            (username,),
-        )
-        row = cursor.fetchone()
-        if row:
-            user_id, existing_country = row
-            if country_code and country_code != existing_country:
-                cursor.execute(
-                    "UPDATE users SET country_code = %s WHERE id = %s",
-                    (country_code, user_id),
-                )
-            return user_id
+def country_to_store(current_user: dict, country_code: str | None) -> str | None:
+    """Country code to write for ``current_user``, or None when it is unchanged.
 
-        created_country = country_code or "??"
-        cursor.execute(
-            "INSERT INTO users (username, country_code) VALUES (%s, %s) RETURNING id",
-            (username, created_country),
-        )
-        return cursor.fetchone()[0]
+    Score inserts feed this to a ``country_update`` CTE, so a changed country
+    is saved by the same statement as the score.
+    """
+    if country_code and country_code != current_user.get("country_code"):
+        return country_code
+    return None
 
 
-def get_user_by_id(conn, user_id: int) -> Optional[dict]:
-    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
-        cursor.execute(
-            "SELECT id, username, country_code, password_hash FROM users WHERE id = %s",
-            (user_id,),
-        )
-        row = cursor.fetchone()
-        return dict(row) if row else None
-
-
-def resolve_user_id(conn, current_user: Optional[dict], username: Optional[str], country_code: str | None) -> int:
-    if current_user:
-        user_id = current_user["id"]
-        if country_code and country_code != current_user.get("country_code"):
-            with conn.cursor() as cursor:
-                cursor.execute(
-                    "UPDATE users SET country_code = %s WHERE id = %s",
-                    (country_code, user_id),
-                )
-        return user_id
-
-    assert_valid_username(username or "")
-    return get_or_create_user(conn, username, country_code)
-
 def is_profile_complete(user: Optional[dict]) -> bool:
     if not user:
         return False
@@ -114,32 +68,62 @@ def is_profile_complete(user: Optional[dict]) -> bool:
 
 
 def fetch_recent_attempts(conn, user_id: int) -> list[dict]:
-    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+    """Latest 20 rounds across all games, newest first.
+
+    Postgres builds the JSON array itself, so this is one row to decode rather
+    than 20 dict rows; ``created_at`` therefore comes back as an ISO string.
+    """
+    # Each branch is capped on its own so Postgres can walk the
+    # (user_id, created_at DESC) index and stop after 20 rows per game
+    # instead of sorting the user's entire history.
+    with conn.cursor() as cursor:
         cursor.execute(
             """
-            SELECT 'reaction' AS game, score AS score, created_at
-            FROM reaction_scores
-            WHERE user_id = %s
-            UNION ALL
-            SELECT 'memory' AS game, total_score AS score, created_at
-            FROM memory_scores
-            WHERE user_id = %s
-            UNION ALL
-            SELECT 'arithmetic_r1' AS game, score AS score, created_at
-            FROM math_round1_scores
-            WHERE user_id = %s
-            UNION ALL
-            SELECT 'arithmetic_r2' AS game, score AS score, created_at
-            FROM math_round_mixed_scores
-            WHERE user_id = %s AND (round_index = 2 OR round_index IS NULL)
-            UNION ALL
-            SELECT 'arithmetic_r3' AS game, score AS score, created_at
-            FROM math_round_mixed_scores
-            WHERE user_id = %s AND round_index = 3
-            ORDER BY created_at DESC
-            LIMIT 20
+            SELECT COALESCE(json_agg(recent ORDER BY recent.created_at DESC), '[]'::json)
+            FROM (
+                (
+                    SELECT 'reaction' AS game, score AS score, created_at
+                    FROM reaction_scores
+                    WHERE user_id = %s
+                    ORDER BY created_at DESC
+                    LIMIT 20
+                )
+                UNION ALL
+                (
+                    SELECT 'memory' AS game, total_score AS score, created_at
+                    FROM memory_scores
+                    WHERE user_id = %s
+                    ORDER BY created_at DESC
+                    LIMIT 20
+                )
+                UNION ALL
+                (
+                    SELECT 'arithmetic_r1' AS game, score AS score, created_at
+                    FROM math_round1_scores
+                    WHERE user_id = %s
+                    ORDER BY created_at DESC
+                    LIMIT 20
+                )
+                UNION ALL
+                (
+                    SELECT 'arithmetic_r2' AS game, score AS score, created_at
+                    FROM math_round_mixed_scores
+                    WHERE user_id = %s AND (round_index = 2 OR round_index IS NULL)
+                    ORDER BY created_at DESC
+                    LIMIT 20
+                )
+                UNION ALL
+                (
+                    SELECT 'arithmetic_r3' AS game, score AS score, created_at
+                    FROM math_round_mixed_scores
+                    WHERE user_id = %s AND round_index = 3
+                    ORDER BY created_at DESC
+                    LIMIT 20
+                )
+                ORDER BY created_at DESC
+                LIMIT 20
+            ) AS recent
             """,
             (user_id, user_id, user_id, user_id, user_id),
         )
-        rows = cursor.fetchall() or []
-        return [dict(r) for r in rows]
+        return cursor.fetchone()[0]
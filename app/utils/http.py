@@ -0,0 +1,110 @@
+import hashlib
+
+import orjson
+from fastapi import HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+
+
+# Generous for any real game submission; anything larger is refused before
+# it is buffered in full or handed to a JSON parser.
+MAX_JSON_BODY_BYTES = 512 * 1024
+
+
+async def read_limited_body(request: Request, limit: int = MAX_JSON_BODY_BYTES) -> bytes:
+    """Read the request body, answering 413 as soon as it exceeds ``limit``."""
+    content_length = request.headers.get("content-length")
+    if content_length is not None:
+        try:
+            if int(content_length) > limit:
+                raise HTTPException(status_code=413, detail="Request body too large")
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Content-Length")
+
+    # The header may be missing (chunked) or lie, so count what actually arrives.
+    chunks = []
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > limit:
+            raise HTTPException(status_code=413, detail="Request body too large")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+async def read_json_object(request: Request) -> dict:
+    """Decode a JSON object request body with orjson.
+
+    Replaces ``await request.json()``, which goes through the stdlib decoder.
+    """
+    body = await read_limited_body(request)
+    try:
+        data = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=422, detail="JSON body must be an object")
+    return data
+
+
+def json_body(model: type[BaseModel]):
+    """Dependency that validates the raw body against ``model`` in one pass.
+
+    pydantic-core parses and validates straight from bytes, skipping the
+    intermediate dict that ``request.json()`` would build.
+    """
+
+    async def dependency(request: Request) -> BaseModel:
+        body = await read_limited_body(request)
+        try:
+            return model.model_validate_json(body)
+        except ValidationError as exc:
+            raise RequestValidationError(exc.errors(include_url=False), body=body)
+
+    return dependency
+
+
+def _opaque_tag(etag: str) -> str:
+    etag = etag.strip()
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Weak comparison of ``etag`` against an If-None-Match list (RFC 9110 13.1.2)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Opaque tags are quoted and cannot contain commas, so splitting is safe.
+    target = _opaque_tag(etag)
+    return any(_opaque_tag(candidate) == target for candidate in if_none_match.split(","))
+
+
+def apply_etag(request: Request, response: Response, cache_control: str = "private, no-cache") -> Response:
+    """Tag a fully rendered response and answer a matching revalidation with 304.
+
+    The default Cache-Control lets the browser keep its copy but revalidate
+    every time, which suits pages carrying per-session data (CSRF token,
+    current user): an unchanged page costs a tiny 304 instead of the full body.
+    """
+    # Weak, because GZipMiddleware may compress the body after this point and
+    # the gzip and identity encodings must not share a strong validator.
+    etag = 'W/"' + hashlib.blake2b(response.body, digest_size=16).hexdigest() + '"'
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        not_modified = Response(status_code=304)
+        for key, value in response.raw_headers:
+            if key == b"set-cookie":
+                not_modified.raw_headers.append((key, value))
+        response = not_modified
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
+    return response
+
+
+def etag_json_response(request: Request, body: bytes) -> Response:
+    """Serve a prebuilt JSON body, revalidated by ETag.
+
+    Leaderboard bodies only change when a new score lands, so a client
+    polling an unchanged board gets a 304 instead of the full payload.
+    """
+    return apply_etag(request, Response(content=body, media_type="application/json"))